@@ -0,0 +1,11 @@
+''' Performance benchmarks. They run against their own database, never the app's:
+BENCH_DATABASE_URL if set, otherwise a fresh SQLite file in a temp directory.
+Login throttling is off unless set explicitly, the load generator logs in from one address. '''
+import os
+import tempfile
+
+os.environ["DATABASE_URL"] = os.environ.get("BENCH_DATABASE_URL") or (
+    "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="todo-bench-"), "bench.db")
+)
+os.environ.setdefault("LOGIN_ATTEMPTS_PER_USERNAME", "0")
+os.environ.setdefault("LOGIN_ATTEMPTS_PER_IP", "0")
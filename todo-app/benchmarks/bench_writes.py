@@ -0,0 +1,76 @@
+''' Latency of creating a user: duplicate checks + INSERT + refresh vs a single INSERT ... RETURNING.
+The password is hashed once up front, so only the database work is compared.
+
+Run from todo-app:  python -m benchmarks.bench_writes [WRITES]
+'''
+import asyncio
+import statistics
+import sys
+import time
+from sqlalchemy import event, insert, select
+from benchmarks.seed import seed
+from database import AsyncSessionLocal, async_engine
+from models.base import Company, User
+from routers.user import USER_CONSTRAINTS
+from utils.password import pwd_context
+from utils.writes import write_returning
+
+
+async def checked_then_refreshed(db, values):
+    ''' The previous write path: look for the company and duplicates first, refresh after '''
+    await db.get(Company, values["company_id"])
+    await db.execute(select(User).where(User.username == values["username"]))
+    await db.execute(select(User).where(User.email == values["email"]))
+    user = User(**values)
+    db.add(user)
+    await db.commit()
+    await db.refresh(user)
+    return user
+
+
+async def single_statement(db, values):
+    ''' INSERT ... RETURNING, constraints checked by the database '''
+    return await write_returning(db, insert(User).values(**values).returning(User), USER_CONSTRAINTS)
+
+
+async def measure(write, prefix: str, writes: int, password: str) -> tuple[float, float]:
+    ''' Mean milliseconds and statements per write '''
+    statements = 0
+
+    def count(*args):
+        nonlocal statements
+        statements += 1
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count)
+    latencies = []
+    try:
+        for i in range(writes):
+            values = {
+                "username": f"{prefix}{i}", "email": f"{prefix}{i}@example.com", "password": password,
+                "first_name": "Bench", "last_name": "Write", "is_active": True, "is_admin": False,
+                "company_id": 1,
+            }
+            async with AsyncSessionLocal() as db:
+                start = time.perf_counter()
+                await write(db, values)
+                latencies.append(time.perf_counter() - start)
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", count)
+    return statistics.fmean(latencies) * 1000, statements / writes
+
+
+async def main(writes: int):
+    seed(1000)
+    password = pwd_context.hash("benchpass")
+    # prefixes are unique per run so the benchmark database can be reused
+    run = int(time.time())
+    before, before_statements = await measure(checked_then_refreshed, f"checked{run}_", writes, password)
+    after, after_statements = await measure(single_statement, f"single{run}_", writes, password)
+    print(f"{writes} user creations")
+    print(f"  checks + INSERT + refresh: {before:8.3f} ms/write, {before_statements:.0f} statements")
+    print(f"  INSERT ... RETURNING:      {after:8.3f} ms/write, {after_statements:.0f} statements"
+          f"  ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
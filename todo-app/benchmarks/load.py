@@ -0,0 +1,168 @@
+''' In-process load generator: drives the ASGI app with concurrent requests per endpoint
+and reports latency percentiles and throughput, optionally against a stored baseline.
+
+Run from todo-app:
+    python -m benchmarks.load --tasks 10000 --requests 500 --concurrency 16
+    python -m benchmarks.load --tasks 1000000 --save large
+    python -m benchmarks.load --tasks 1000000 --compare large
+'''
+import argparse
+import asyncio
+import json
+import logging
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+import httpx
+from benchmarks.seed import BENCH_PASSWORD, seed
+
+BASELINE_DIR = Path(__file__).parent / "baselines"
+
+# one log line per request would swamp the report and skew the timings
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# name -> (method, path template, needs a bearer token); templates are filled with random seeded ids
+ENDPOINTS = {
+    "list_tasks": ("GET", "/tasks/?limit=50", False),
+    "list_tasks_by_priority": ("GET", "/tasks/?limit=50&sort=-priority&priority_max={priority}", False),
+    "list_tasks_filtered": ("GET", "/tasks/?user_id={user_id}&status=true&limit=50", False),
+    "get_task": ("GET", "/tasks/{task_id}", False),
+    "get_task_expanded": ("GET", "/tasks/{task_id}?expand=user", False),
+    "tasks_by_user": ("GET", "/tasks/user/{user_id}", False),
+    "search_tasks": ("GET", "/tasks/search?q={word}&limit=20", False),
+    "list_users": ("GET", "/users/?limit=50", False),
+    "get_user_expanded": ("GET", "/users/{user_id}?expand=company", False),
+    "me": ("GET", "/users/me", True),
+    "list_companies": ("GET", "/companies/?expand=users", False),
+    "login": ("POST", "/login/", False),
+}
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    ''' Nearest-rank percentile of an already sorted list '''
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_endpoint(client, name, counts, requests, concurrency, token, rng) -> dict:
+    ''' Send `requests` requests to one endpoint from `concurrency` concurrent workers '''
+    method, template, needs_token = ENDPOINTS[name]
+    headers = {"Authorization": f"Bearer {token}"} if needs_token else {}
+    latencies, errors = [], 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            path = template.format(
+                task_id=rng.randint(1, counts["tasks"]),
+                user_id=rng.randint(1, counts["users"]),
+                priority=rng.randint(1, 5),
+                word=rng.choice(["report", "deploy", "budget", "review"]),
+            )
+            kwargs = {}
+            if name == "login":
+                kwargs["data"] = {"username": f"user{rng.randrange(counts['users'])}", "password": BENCH_PASSWORD}
+            start = time.perf_counter()
+            response = await client.request(method, path, headers=headers, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput": requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+    }
+
+
+async def run(names, counts, requests, concurrency, seed_value) -> dict:
+    # imported here so the app binds to the benchmark database set up by the package
+    from main import app
+    rng = random.Random(seed_value)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post("/login/", data={"username": "user0", "password": BENCH_PASSWORD})
+        response.raise_for_status()
+        token = response.json()["access_token"]
+        results = {}
+        for name in names:
+            # warm up connections, caches and code paths before measuring
+            await run_endpoint(client, name, counts, min(20, requests), concurrency, token, rng)
+            results[name] = await run_endpoint(client, name, counts, requests, concurrency, token, rng)
+        return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    ''' Endpoints slower (p95) or slower to serve (throughput) than the baseline beyond `tolerance` '''
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']:.1f}ms vs baseline {base['p95_ms']:.1f}ms")
+        if result["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {result['throughput']:.0f} req/s vs baseline {base['throughput']:.0f} req/s"
+            )
+    return regressions
+
+
+def print_table(results: dict):
+    print(f"{'endpoint':<24}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, r in results.items():
+        print(f"{name:<24}{r['throughput']:>10.0f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}"
+              f"{r['p99_ms']:>10.2f}{r['errors']:>8}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=10_000, help="tasks to seed (e.g. 10000, 1000000)")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--companies", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=500, help="measured requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--only", help="comma separated endpoint names, default all but login")
+    parser.add_argument("--seed", type=int, default=42, help="random seed for data and request mix")
+    parser.add_argument("--save", metavar="NAME", help="store results as baseline NAME")
+    parser.add_argument("--compare", metavar="NAME", help="fail if results regress from baseline NAME")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression, fraction")
+    args = parser.parse_args(argv)
+
+    names = args.only.split(",") if args.only else [name for name in ENDPOINTS if name != "login"]
+    unknown = set(names) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    counts = seed(args.tasks, args.users, args.companies, args.seed)
+    print(f"seeded {counts}, {args.requests} requests per endpoint, concurrency {args.concurrency}")
+    results = asyncio.run(run(names, counts, args.requests, args.concurrency, args.seed))
+    print_table(results)
+
+    report = {"counts": counts, "requests": args.requests, "concurrency": args.concurrency, "results": results}
+    if args.save:
+        BASELINE_DIR.mkdir(exist_ok=True)
+        (BASELINE_DIR / f"{args.save}.json").write_text(json.dumps(report, indent=2) + "\n")
+        print(f"baseline saved to {BASELINE_DIR / args.save}.json")
+    if args.compare:
+        baseline = json.loads((BASELINE_DIR / f"{args.compare}.json").read_text())
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
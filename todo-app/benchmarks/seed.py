@@ -0,0 +1,67 @@
+''' Seed the benchmark database with a configurable volume of companies, users and tasks '''
+import random
+from sqlalchemy import func, insert, select
+from database import Base, engine
+from models.base import Company, Task, User
+from utils.password import pwd_context
+
+BENCH_PASSWORD = "benchpass"
+INSERT_BATCH_SIZE = 10_000
+WORDS = ["report", "invoice", "meeting", "deploy", "review", "release", "backup", "design", "budget", "hiring"]
+
+
+def seed(tasks: int, users: int = 100, companies: int = 10, seed_value: int = 42) -> dict:
+    ''' Create the schema and fill it until it holds at least `tasks` tasks. A database
+    seeded before (e.g. a persistent BENCH_DATABASE_URL) is topped up: companies and
+    users that exist are reused, only the missing ones and tasks are added.
+    Every user's password is BENCH_PASSWORD. Returns the row counts. '''
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        existing_tasks = conn.execute(select(func.count(Task.id))).scalar()
+        if existing_tasks >= tasks:
+            return counts(conn)
+        rng = random.Random(seed_value + existing_tasks)
+        company_names = [f"Company {i}" for i in range(companies)]
+        company_ids = ids_by(conn, Company.name, company_names)
+        missing = [i for i, name in enumerate(company_names) if name not in company_ids]
+        if missing:
+            conn.execute(insert(Company), [
+                {"name": company_names[i], "description": "Benchmark company", "mode": "public", "rating": i % 5}
+                for i in missing
+            ])
+            company_ids = ids_by(conn, Company.name, company_names)
+        usernames = [f"user{i}" for i in range(users)]
+        user_ids = ids_by(conn, User.username, usernames)
+        missing = [i for i, name in enumerate(usernames) if name not in user_ids]
+        if missing:
+            # one bcrypt hash for everyone, hashing per user would dominate seeding time
+            password = pwd_context.hash(BENCH_PASSWORD)
+            conn.execute(insert(User), [{
+                "username": usernames[i], "email": f"user{i}@example.com", "password": password,
+                "first_name": "Bench", "last_name": f"User {i}",
+                "is_active": True, "is_admin": False, "company_id": company_ids[company_names[i % companies]],
+            } for i in missing])
+            user_ids = ids_by(conn, User.username, usernames)
+        owners = list(user_ids.values())
+        for start in range(existing_tasks, tasks, INSERT_BATCH_SIZE):
+            conn.execute(insert(Task), [{
+                "summary": f"{rng.choice(WORDS)} {i}",
+                "description": " ".join(rng.choices(WORDS, k=8)),
+                "status": rng.random() < 0.3,
+                "priority": rng.choice([None, 1, 2, 3, 4, 5]),
+                "user_id": rng.choice(owners),
+            } for i in range(start, min(start + INSERT_BATCH_SIZE, tasks))])
+        return counts(conn)
+
+
+def ids_by(conn, column, values: list[str]) -> dict[str, int]:
+    ''' Primary key of each row whose `column` is one of `values`, by that value '''
+    table = column.class_
+    return dict(conn.execute(select(column, table.id).where(column.in_(values))).all())
+
+
+def counts(conn) -> dict:
+    return {
+        model.__tablename__: conn.execute(select(func.count(model.id))).scalar()
+        for model in (Company, User, Task)
+    }
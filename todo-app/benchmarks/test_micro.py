@@ -0,0 +1,84 @@
+''' Micro benchmarks for the CPU-bound pieces of a request (pytest-benchmark).
+
+Run from todo-app:
+    python -m pytest benchmarks/ --no-cov --benchmark-autosave
+    python -m pytest benchmarks/ --no-cov --benchmark-compare --benchmark-compare-fail=median:20%
+'''
+from datetime import timedelta
+import orjson
+import pytest
+from models.base import Task
+from schemas import expanded as schemas_expanded, task as schemas_task
+from schemas.pagination import Page
+from utils.auth_user import create_access_token
+from utils.expand import expanded
+from utils.fast_json import ORJSONResponse
+from utils.jwt_keys import key_set
+from utils.pagination import decode_cursor, encode_cursor
+from utils.password import pwd_context
+from utils.response_cache import response_cache
+
+pytest.importorskip("pytest_benchmark")
+
+PAGE_SIZE = 500
+
+
+@pytest.fixture(scope="module")
+def task_rows():
+    return [
+        {"id": i, "summary": f"Task {i}", "description": "Benchmark task " * 4,
+         "status": i % 2 == 0, "priority": i % 5 or None, "user_id": i % 100 + 1, "version": 0}
+        for i in range(1, PAGE_SIZE + 1)
+    ]
+
+
+@pytest.fixture(scope="module")
+def task_objects(task_rows):
+    return [Task(**row) for row in task_rows]
+
+
+def test_serialize_page_pydantic(benchmark, task_objects):
+    adapter = response_cache.adapter(Page[schemas_expanded.TaskExpanded])
+
+    def serialize():
+        page = {"items": [expanded(task, set()) for task in task_objects], "next_cursor": None}
+        return adapter.dump_json(adapter.validate_python(page), exclude_unset=True)
+    assert orjson.loads(benchmark(serialize))["items"][0]["id"] == 1
+
+
+def test_serialize_page_orjson(benchmark, task_rows):
+    body = benchmark(lambda: ORJSONResponse({"items": task_rows, "next_cursor": None}).body)
+    assert orjson.loads(body)["items"][0]["id"] == 1
+
+
+def test_serialize_single_task(benchmark, task_objects):
+    body = benchmark(
+        lambda: schemas_task.Task.model_validate(task_objects[0], from_attributes=True).model_dump_json()
+    )
+    assert b'"id":1' in body.encode()
+
+
+def test_hash_password(benchmark):
+    # bcrypt is slow by design, a few rounds are enough to see a cost change
+    hashed = benchmark.pedantic(pwd_context.hash, args=("benchpass",), rounds=5)
+    assert hashed.startswith("$2")
+
+
+def test_verify_password(benchmark):
+    hashed = pwd_context.hash("benchpass")
+    assert benchmark.pedantic(pwd_context.verify, args=("benchpass", hashed), rounds=5)
+
+
+def test_create_token(benchmark):
+    token = benchmark(create_access_token, {"sub": "user0"}, timedelta(minutes=30))
+    assert token.count(".") == 2
+
+
+def test_decode_token(benchmark):
+    token = create_access_token({"sub": "user0"}, timedelta(minutes=30))
+    payload = benchmark(key_set.decode, token)
+    assert payload["sub"] == "user0"
+
+
+def test_cursor_round_trip(benchmark):
+    assert benchmark(lambda: decode_cursor(encode_cursor([3, 12345]))) == [3, 12345]
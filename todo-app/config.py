@@ -0,0 +1,134 @@
+''' Application settings, each one can be overridden by an environment variable of the same name '''
+import os
+
+
+def env_int(name: str, default: int) -> int:
+    ''' Read an integer setting from the environment '''
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def env_bool(name: str, default: bool) -> bool:
+    ''' Read a boolean setting from the environment ("1", "true", "yes" are true) '''
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def env_str(name: str, default: str) -> str:
+    ''' Read a string setting from the environment '''
+    return os.getenv(name) or default
+
+
+def env_list(name: str) -> list[str]:
+    ''' Read a comma separated list setting from the environment '''
+    return [item.strip() for item in os.getenv(name, "").split(",") if item.strip()]
+
+
+class Settings:
+    ''' Tunables for the API, read once at import time '''
+    def __init__(self):
+        # Database, any SQLAlchemy URL; the async driver is derived from it
+        self.DATABASE_URL = env_str("DATABASE_URL", "sqlite:///./todo-db.db")
+        # Connection pool (ignored for in-memory SQLite)
+        self.DB_POOL_SIZE = env_int("DB_POOL_SIZE", 5)
+        self.DB_MAX_OVERFLOW = env_int("DB_MAX_OVERFLOW", 10)
+        self.DB_POOL_TIMEOUT = env_int("DB_POOL_TIMEOUT", 30)
+        self.DB_POOL_RECYCLE = env_int("DB_POOL_RECYCLE", 1800)
+        self.DB_POOL_PRE_PING = env_bool("DB_POOL_PRE_PING", True)
+        # Read replicas for GET endpoints, comma separated URLs (empty: read from primary)
+        self.DATABASE_REPLICA_URLS = env_list("DATABASE_REPLICA_URLS")
+        # seconds a failing replica is skipped before it is tried again
+        self.REPLICA_RETRY_SECONDS = env_int("REPLICA_RETRY_SECONDS", 30)
+        # seconds a client reads from the primary after one of its writes
+        self.REPLICA_STICKY_SECONDS = env_int("REPLICA_STICKY_SECONDS", 5)
+        # SQLite pragmas applied to every new connection
+        self.SQLITE_JOURNAL_MODE = env_str("SQLITE_JOURNAL_MODE", "WAL")
+        self.SQLITE_SYNCHRONOUS = env_str("SQLITE_SYNCHRONOUS", "NORMAL")
+        self.SQLITE_BUSY_TIMEOUT_MS = env_int("SQLITE_BUSY_TIMEOUT_MS", 5000)
+        self.SQLITE_CACHE_SIZE_KB = env_int("SQLITE_CACHE_SIZE_KB", 65536)
+        self.SQLITE_MMAP_SIZE = env_int("SQLITE_MMAP_SIZE", 268435456)
+
+        # Serve list and export endpoints from plain column rows encoded with orjson
+        self.FAST_LIST_RESPONSES = env_bool("FAST_LIST_RESPONSES", False)
+
+        # Password hashing scheme for new hashes, "bcrypt" or "argon2" (needs argon2-cffi).
+        # Stored hashes made with other parameters are upgraded on the next successful login.
+        self.PASSWORD_SCHEME = env_str("PASSWORD_SCHEME", "bcrypt")
+        self.BCRYPT_ROUNDS = env_int("BCRYPT_ROUNDS", 12)
+        self.ARGON2_TIME_COST = env_int("ARGON2_TIME_COST", 3)
+        self.ARGON2_MEMORY_COST_KB = env_int("ARGON2_MEMORY_COST_KB", 65536)
+        self.ARGON2_PARALLELISM = env_int("ARGON2_PARALLELISM", 4)
+        # Password hashing worker pool
+        self.PASSWORD_HASH_WORKERS = env_int("PASSWORD_HASH_WORKERS", os.cpu_count() or 2)
+        # hash/verify calls allowed to wait or run at once before new ones get a 503
+        self.PASSWORD_HASH_MAX_PENDING = env_int("PASSWORD_HASH_MAX_PENDING", 64)
+
+        # Response cache for read endpoints: "memory" (per process) or "redis" (shared)
+        self.RESPONSE_CACHE_BACKEND = env_str("RESPONSE_CACHE_BACKEND", "memory")
+        self.RESPONSE_CACHE_REDIS_URL = env_str("RESPONSE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+        self.RESPONSE_CACHE_TTL_SECONDS = env_int("RESPONSE_CACHE_TTL_SECONDS", 300)
+        self.RESPONSE_CACHE_MAX_ENTRIES = env_int("RESPONSE_CACHE_MAX_ENTRIES", 1024)
+
+        # Authenticated user cache, 0 disables it
+        self.USER_CACHE_MAX_SIZE = env_int("USER_CACHE_MAX_SIZE", 10000)
+        self.USER_CACHE_TTL_SECONDS = env_int("USER_CACHE_TTL_SECONDS", 60)
+        # Access tokens: HS* algorithms sign with JWT_SECRET_KEY, RS*/ES* with a PEM private key file.
+        # Keys listed as previous/public stay valid for verification while rotating.
+        self.JWT_ALGORITHM = env_str("JWT_ALGORITHM", "HS256")
+        self.JWT_SECRET_KEY = env_str("JWT_SECRET_KEY", "super-secret-key")
+        self.JWT_PREVIOUS_SECRET_KEYS = env_list("JWT_PREVIOUS_SECRET_KEYS")
+        self.JWT_PRIVATE_KEY_FILE = env_str("JWT_PRIVATE_KEY_FILE", "")
+        self.JWT_PUBLIC_KEY_FILES = env_list("JWT_PUBLIC_KEY_FILES")
+        # Login attempts allowed per username / per client IP within the window (0: no limit)
+        self.LOGIN_ATTEMPTS_PER_USERNAME = env_int("LOGIN_ATTEMPTS_PER_USERNAME", 5)
+        self.LOGIN_ATTEMPTS_PER_IP = env_int("LOGIN_ATTEMPTS_PER_IP", 20)
+        self.LOGIN_RATE_WINDOW_SECONDS = env_int("LOGIN_RATE_WINDOW_SECONDS", 60)
+        # "memory" (per worker) or "redis" (shared by all workers)
+        self.LOGIN_RATE_LIMIT_BACKEND = env_str("LOGIN_RATE_LIMIT_BACKEND", "memory")
+        self.LOGIN_RATE_LIMIT_REDIS_URL = env_str("LOGIN_RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+        self.LOGIN_RATE_LIMIT_MAX_KEYS = env_int("LOGIN_RATE_LIMIT_MAX_KEYS", 100000)
+        # Background jobs: worker tasks per process, how often idle workers look for jobs
+        # queued by other processes, how long a claimed job stays locked without progress,
+        # runs before a failing job is given up, and rows handled per transaction by cascades
+        self.JOB_WORKERS = env_int("JOB_WORKERS", 2)
+        self.JOB_POLL_SECONDS = env_int("JOB_POLL_SECONDS", 2)
+        self.JOB_LEASE_SECONDS = env_int("JOB_LEASE_SECONDS", 300)
+        self.JOB_MAX_ATTEMPTS = env_int("JOB_MAX_ATTEMPTS", 3)
+        self.JOB_CHUNK_SIZE = env_int("JOB_CHUNK_SIZE", 500)
+        # Lifetime of refresh tokens, and how often each worker picks up revocations made by others
+        self.REFRESH_TOKEN_EXPIRE_DAYS = env_int("REFRESH_TOKEN_EXPIRE_DAYS", 14)
+        self.REVOCATION_SYNC_SECONDS = env_int("REVOCATION_SYNC_SECONDS", 5)
+        # Trust the claims of a token whose version is current instead of loading the user
+        self.JWT_STATELESS = env_bool("JWT_STATELESS", False)
+        # Per-route and database metrics served on /metrics
+        self.METRICS_ENABLED = env_bool("METRICS_ENABLED", True)
+        # Statements slower than this are logged with their parameters and plan (0 disables)
+        self.SLOW_QUERY_MS = env_int("SLOW_QUERY_MS", 500)
+        self.SLOW_QUERY_EXPLAIN = env_bool("SLOW_QUERY_EXPLAIN", True)
+        # Profile every request, or only those sending PROFILE_HEADER: 1
+        self.PROFILE_REQUESTS = env_bool("PROFILE_REQUESTS", False)
+        self.PROFILE_HEADER_ALLOWED = env_bool("PROFILE_HEADER_ALLOWED", True)
+        self.PROFILE_HEADER = env_str("PROFILE_HEADER", "X-Profile")
+
+        # HTTP server run by `python manage.py serve`: worker processes, event loop and
+        # HTTP parser ("auto" picks uvloop / httptools when installed), seconds an idle
+        # keep-alive connection is held (keep it above the load balancer's idle timeout),
+        # pending connections the socket queues, and seconds in-flight requests get to
+        # finish on shutdown
+        self.SERVER_HOST = env_str("SERVER_HOST", "0.0.0.0")
+        self.SERVER_PORT = env_int("SERVER_PORT", 8000)
+        # 0: one per CPU core when the response cache is shared (redis), else one
+        self.SERVER_WORKERS = env_int("SERVER_WORKERS", 0)
+        self.SERVER_LOOP = env_str("SERVER_LOOP", "auto")
+        self.SERVER_HTTP = env_str("SERVER_HTTP", "auto")
+        self.SERVER_KEEP_ALIVE_SECONDS = env_int("SERVER_KEEP_ALIVE_SECONDS", 65)
+        self.SERVER_BACKLOG = env_int("SERVER_BACKLOG", 2048)
+        self.SERVER_GRACEFUL_SHUTDOWN_SECONDS = env_int("SERVER_GRACEFUL_SHUTDOWN_SECONDS", 30)
+        # proxies whose X-Forwarded-For is trusted, so per-IP login limits see the real client
+        self.SERVER_FORWARDED_ALLOW_IPS = env_str("SERVER_FORWARDED_ALLOW_IPS", "127.0.0.1")
+        self.SERVER_ACCESS_LOG = env_bool("SERVER_ACCESS_LOG", True)
+
+
+settings = Settings()
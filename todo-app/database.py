@@ -1,22 +1,235 @@
-from sqlalchemy import create_engine
+import itertools
+import logging
+import time
+from fastapi import Depends, Request
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from config import settings
+from utils.metrics import TimedCheckout
+from utils.profiling import instrument_engine
 
-# SQLite URL
-SQLALCHEMY_DATABASE_URL = "sqlite:///./todo-db.db"  # file-based
+# Database URL, set DATABASE_URL to override
+SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL  # default file-based SQLite
 # For memory-only DB: "sqlite:///:memory:"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# async drivers used by the request path, keyed by the plain dialect name
+ASYNC_DRIVERS = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+}
+
+
+def to_async_url(url: str) -> str:
+    ''' Turn a sync database URL into the matching async driver URL '''
+    parsed = make_url(url)
+    if parsed.get_dialect().is_async:
+        return url
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver configured for {parsed.get_backend_name()}")
+    return parsed.set(drivername=f"{parsed.get_backend_name()}+{driver}").render_as_string(
+        hide_password=False
+    )
+
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    ''' Tune every new SQLite connection.
+
+    WAL lets readers run while a writer commits, synchronous=NORMAL is safe
+    with WAL and saves an fsync per commit, and busy_timeout makes writers
+    wait for the lock instead of failing straight away.
+    '''
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS:d}")
+    # negative cache_size is in KiB rather than pages
+    cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB:d}")
+    cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE:d}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    # off by default in SQLite; writes rely on it to reject dangling references
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+class TimedQueuePool(TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    ''' Keyword arguments for create_engine / create_async_engine from settings '''
+    parsed = make_url(url)
+    options = {}
+    if is_sqlite(url):
+        if not is_async:
+            options["connect_args"] = {"check_same_thread": False}
+        if parsed.database in (None, "", ":memory:"):
+            # in-memory databases use a single shared connection, no pool to size
+            return options
+    options.update(
+        # the engines' default queue pools, also timing how long checkouts wait
+        poolclass=TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    return options
+
+
+def build_engine(url: str) -> Engine:
+    ''' Sync engine for `url`, pooled and tuned according to settings '''
+    new_engine = create_engine(url, **engine_options(url))
+    instrument_engine(new_engine)
+    if is_sqlite(url):
+        event.listen(new_engine, "connect", set_sqlite_pragmas)
+    return new_engine
+
+
+def build_async_engine(url: str) -> AsyncEngine:
+    ''' Async engine for `url` (sync URLs are mapped to their async driver) '''
+    url = to_async_url(url)
+    new_engine = create_async_engine(url, **engine_options(url, is_async=True))
+    instrument_engine(new_engine.sync_engine)
+    if is_sqlite(url):
+        event.listen(new_engine.sync_engine, "connect", set_sqlite_pragmas)
+    return new_engine
+
+
+# Sync engine: schema creation, migrations and scripts
+engine = build_engine(SQLALCHEMY_DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine: used by every request handler so queries don't block the event loop
+async_engine = build_async_engine(SQLALCHEMY_DATABASE_URL)
+
+# expire_on_commit=False keeps loaded attributes readable after commit,
+# an expired attribute would need implicit (blocking) IO to reload
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
 
 # Dependency
-def get_db():
-    db = SessionLocal()
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+logger = logging.getLogger(__name__)
+
+# clients send this header, or carry this cookie after a write, to read from the primary
+CONSISTENCY_HEADER = "X-Consistency"
+PRIMARY_COOKIE = "read_primary_until"
+
+
+class Replica:
+    ''' One read replica and when it may be tried again after a failure '''
+    def __init__(self, url: str):
+        self.url = url
+        self.engine = build_async_engine(url)
+        self.sessionmaker = async_sessionmaker(
+            self.engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+        )
+        self.down_until = 0.0
+
+    def available(self) -> bool:
+        return self.down_until <= time.monotonic()
+
+
+class ReplicaRouter:
+    ''' Hands out sessions on read replicas, round-robin.
+
+    A replica whose connection check fails is skipped for `retry_after`
+    seconds; when none is usable the caller falls back to the primary.
+    '''
+    def __init__(self, urls: list[str], retry_after: float):
+        self.replicas = [Replica(url) for url in urls]
+        self.retry_after = retry_after
+        self._turn = itertools.count()
+
+    def __bool__(self) -> bool:
+        return bool(self.replicas)
+
+    async def session(self) -> AsyncSession | None:
+        ''' A session on the next healthy replica, or None if there is none '''
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[next(self._turn) % len(self.replicas)]
+            if not replica.available():
+                continue
+            session = replica.sessionmaker()
+            try:
+                # check out (and with pool_pre_ping, validate) a connection up front
+                await session.connection()
+            except (DBAPIError, OSError) as e:
+                await session.close()
+                replica.down_until = time.monotonic() + self.retry_after
+                logger.warning("Replica %s is unavailable: %s", replica.url, e)
+                continue
+            session.info["replica"] = True
+            return session
+        return None
+
+
+replica_router = ReplicaRouter(settings.DATABASE_REPLICA_URLS, settings.REPLICA_RETRY_SECONDS)
+
+
+def is_replica(db: AsyncSession) -> bool:
+    ''' Whether `db` reads a replica, which may lag behind the primary '''
+    return db.info.get("replica", False)
+
+
+def wants_primary(request: Request) -> bool:
+    ''' Whether this read must see the client's own recent writes '''
+    if request.headers.get(CONSISTENCY_HEADER, "").lower() == "strong":
+        return True
     try:
+        return float(request.cookies.get(PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+# Dependency for read-only handlers
+async def get_read_db(request: Request, db: AsyncSession = Depends(get_db)):
+    ''' Yield a replica session for reads, or the primary session `db`
+    when no replica is configured or healthy, or the client needs its own writes '''
+    if not replica_router or wants_primary(request):
+        yield db
+        return
+    replica_db = await replica_router.session()
+    if replica_db is None:
         yield db
+        return
+    try:
+        yield replica_db
     finally:
-        db.close()
+        await replica_db.close()
+
+
+async def read_your_writes(request: Request, call_next):
+    ''' Middleware: after a successful write, pin the client's reads to the
+    primary for REPLICA_STICKY_SECONDS so it never reads behind replication lag '''
+    response = await call_next(request)
+    if replica_router and request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        response.set_cookie(
+            PRIMARY_COOKIE,
+            str(time.time() + settings.REPLICA_STICKY_SECONDS),
+            max_age=settings.REPLICA_STICKY_SECONDS,
+            httponly=True,
+        )
+    return response
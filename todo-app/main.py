@@ -1,6 +1,29 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from routers import user, company, task, auth
-from database import engine, Base
+from config import settings
+from routers import user, company, task, auth, job, metrics
+from database import AsyncSessionLocal, async_engine, engine, read_your_writes, replica_router
+from utils.fast_json import ORJSONResponse
+from utils.jobs import job_queue
+from utils.metrics import record_metrics, track_pool
+from utils.profiling import profile_requests
+from utils.revocation import revocation_list
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    ''' Keep the revocation list in step with the other workers and run
+    background jobs while serving. The schema is not touched here: every worker
+    runs this, create or upgrade it once with `python manage.py migrate` '''
+    sync_task = asyncio.create_task(revocation_list.keep_synced(AsyncSessionLocal))
+    job_queue.start(AsyncSessionLocal)
+    yield
+    await job_queue.stop(settings.SERVER_GRACEFUL_SHUTDOWN_SECONDS)
+    sync_task.cancel()
+    # close pooled connections cleanly instead of leaving them to the process exit
+    await async_engine.dispose()
+
 
 app = FastAPI(
     title="To-do API",
@@ -8,11 +31,28 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
-    openapi_url="/openapi.json"
+    openapi_url="/openapi.json",
+    # routes with a response_model are still dumped by Pydantic in one pass,
+    # this only renders plain dicts returned without one
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
-Base.metadata.create_all(bind=engine)  # create tables
+
+app.middleware("http")(read_your_writes)
+
+if settings.METRICS_ENABLED:
+    app.middleware("http")(record_metrics)
+    track_pool(engine, "sync")
+    track_pool(async_engine.sync_engine, "primary")
+    for i, replica in enumerate(replica_router.replicas):
+        track_pool(replica.engine.sync_engine, f"replica{i}")
+    app.include_router(metrics.router)
+
+# added last so it is outermost: it times the whole request and the metrics use its stats
+app.middleware("http")(profile_requests)
 
 app.include_router(user.router)
 app.include_router(company.router)
 app.include_router(task.router)
-app.include_router(auth.router)
\ No newline at end of file
+app.include_router(auth.router)
+app.include_router(job.router)
\ No newline at end of file
@@ -0,0 +1,144 @@
+''' Deployment and maintenance commands, run from todo-app:
+    python manage.py migrate              # bring the schema to the latest migration
+    python manage.py serve --workers 8    # serve the API from 8 processes
+    python manage.py rebuild-stats
+'''
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from pathlib import Path
+from sqlalchemy.ext.asyncio import AsyncEngine
+from config import settings
+from database import async_engine
+from utils.response_cache import response_cache
+from utils.task_stats import rebuild
+
+APP_DIR = Path(__file__).parent
+
+logger = logging.getLogger(__name__)
+
+
+def alembic_config():
+    ''' Alembic configuration for versions/, pointed at DATABASE_URL '''
+    try:
+        from alembic.config import Config
+    except ImportError:
+        raise SystemExit("migrate needs alembic: pip install alembic")
+    config = Config()
+    config.set_main_option("script_location", str(APP_DIR))
+    # configparser treats % as interpolation, URL-encoded passwords contain it
+    config.set_main_option("sqlalchemy.url", settings.DATABASE_URL.replace("%", "%%"))
+    return config
+
+
+def migrate(revision: str = "head", stamp: bool = False):
+    ''' Upgrade the database to `revision`; with `stamp`, only record it as applied,
+    e.g. for a database whose tables were created by an older version of the app '''
+    config = alembic_config()
+    from alembic import command
+    if stamp:
+        command.stamp(config, revision)
+    else:
+        command.upgrade(config, revision)
+
+
+def default_workers() -> int:
+    ''' One worker per CPU core, but only when the response cache is shared: with
+    a per-process cache the other workers would miss each write for up to
+    RESPONSE_CACHE_TTL_SECONDS '''
+    return (os.cpu_count() or 1) if response_cache.backend.shared else 1
+
+
+def check_workers(workers: int) -> str | None:
+    ''' Why `workers` processes would serve inconsistent answers, if they would '''
+    if workers > 1 and not response_cache.backend.shared:
+        return (f"{workers} workers with RESPONSE_CACHE_BACKEND={settings.RESPONSE_CACHE_BACKEND} would "
+                "serve stale responses, set RESPONSE_CACHE_BACKEND=redis or run a single worker")
+    return None
+
+
+def server_options(args) -> dict:
+    ''' uvicorn settings from the command line, defaulting to the SERVER_* settings '''
+    return {
+        "host": args.host,
+        "port": args.port,
+        "workers": args.workers,
+        "loop": args.loop,
+        "http": args.http,
+        "timeout_keep_alive": args.keep_alive,
+        "backlog": args.backlog,
+        "timeout_graceful_shutdown": args.graceful_shutdown,
+        "forwarded_allow_ips": settings.SERVER_FORWARDED_ALLOW_IPS,
+        "access_log": settings.SERVER_ACCESS_LOG,
+    }
+
+
+def serve(args):
+    ''' Run the API in `args.workers` processes sharing one listening socket.
+    The app is imported here first, so a broken configuration stops the server once
+    instead of crashing every worker. uvicorn starts the workers as fresh processes
+    that import it again: each gets its own event loop and connection pools. SIGTERM
+    or SIGINT stops accepting connections and gives requests in flight up to
+    `args.graceful_shutdown` seconds. The lifespan shutdown then gives running
+    background jobs as long again; one still running is cancelled and queued again
+    right away, for any other worker to pick up. '''
+    import uvicorn
+    # the workers read it from their own settings, for the job shutdown
+    os.environ["SERVER_GRACEFUL_SHUTDOWN_SECONDS"] = str(args.graceful_shutdown)
+    import main  # noqa: F401  preload
+    uvicorn.run("main:app", **server_options(args))
+
+
+async def rebuild_stats(engine: AsyncEngine = async_engine) -> int:
+    ''' Recount task_stats from tasks in one transaction '''
+    async with engine.begin() as conn:
+        return await rebuild(conn)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = commands.add_parser("migrate", help="apply the database migrations")
+    migrate_parser.add_argument("revision", nargs="?", default="head")
+    migrate_parser.add_argument("--stamp", action="store_true",
+                                help="record the revision as applied without running it")
+
+    serve_parser = commands.add_parser("serve", help="run the API server")
+    serve_parser.add_argument("--host", default=settings.SERVER_HOST)
+    serve_parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    serve_parser.add_argument("--workers", type=int, default=settings.SERVER_WORKERS or default_workers(),
+                              help="default: CPU count with a shared response cache, else 1")
+    serve_parser.add_argument("--loop", default=settings.SERVER_LOOP, choices=["auto", "asyncio", "uvloop"])
+    serve_parser.add_argument("--http", default=settings.SERVER_HTTP, choices=["auto", "h11", "httptools"])
+    serve_parser.add_argument("--keep-alive", type=int, default=settings.SERVER_KEEP_ALIVE_SECONDS,
+                              help="seconds an idle connection is kept open")
+    serve_parser.add_argument("--backlog", type=int, default=settings.SERVER_BACKLOG)
+    serve_parser.add_argument("--graceful-shutdown", type=int, default=settings.SERVER_GRACEFUL_SHUTDOWN_SECONDS,
+                              help="seconds requests in flight get to finish on shutdown")
+
+    commands.add_parser("rebuild-stats", help="recount the task statistics, e.g. after they drifted")
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate":
+        migrate(args.revision, args.stamp)
+    elif args.command == "serve":
+        if args.workers < 1:
+            parser.error("--workers must be at least 1")
+        problem = check_workers(args.workers)
+        if problem:
+            parser.error(problem)
+        if args.workers > 1 and settings.LOGIN_RATE_LIMIT_BACKEND == "memory":
+            logger.warning("Login attempts are counted per worker, the limits allow %d times as many "
+                           "attempts; set LOGIN_RATE_LIMIT_BACKEND=redis to share them", args.workers)
+        serve(args)
+    elif args.command == "rebuild-stats":
+        buckets = asyncio.run(rebuild_stats())
+        print(f"task_stats rebuilt, {buckets} buckets")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
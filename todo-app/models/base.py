@@ -1,5 +1,5 @@
 ''' SQLAlchemy models for User, Task, and Company '''
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import DDL, JSON, Column, Index, Integer, String, ForeignKey, event, func
 from database import Base
 from sqlalchemy.orm import relationship
 
@@ -13,6 +13,8 @@ class Company(Base):
     description = Column(String)
     mode = Column(String)  # e.g., "public", "private"
     rating = Column(Integer)  # e.g., 1 (low) to 5 (high)
+    # bumped by every update, PATCH can require the version the client read
+    version = Column(Integer, nullable=False, default=0, server_default="0")
     # relationships to User
     users = relationship("User", back_populates="company")
 
@@ -29,10 +31,12 @@ class User(Base):
     last_name = Column(String, index=True)
     is_active = Column(Integer, default=1)  # 1 for active, 0 for inactive
     is_admin = Column(Integer, default=0)  # 1 for admin
+    # bumped whenever a claim carried by access tokens changes, see utils/auth_user.py
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     # relationships to Task
     tasks = relationship("Task", back_populates="user")
     # relationships to Company
-    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False)  # foreign key to Company
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False, index=True)  # foreign key to Company
     company = relationship("Company", back_populates="users")
 
 
@@ -42,10 +46,146 @@ class Task(Base):
     __tablename__ = "tasks"
 
     id = Column(Integer, primary_key=True, index=True)
-    summary = Column(String, index=True) # brief summary
-    description = Column(String, index=True) # detailed description
+    summary = Column(String) # brief summary
+    description = Column(String) # detailed description
     status = Column(String, index=True)  # e.g., "pending", "in-progress", "completed"
     priority = Column(Integer, index=True)  # e.g., 1 (high) to 5 (low)
     # relationships to User
     user_id = Column(Integer, ForeignKey("users.id"))  # foreign key to User
+    # bumped by every update, PATCH can require the version the client read
+    version = Column(Integer, nullable=False, default=0, server_default="0")
     user = relationship("User", back_populates="tasks")
+
+    __table_args__ = (
+        # serves filters on user_id, user_id + status and user_id + status + priority range
+        Index("ix_tasks_user_id_status_priority", "user_id", "status", "priority"),
+    )
+
+
+class RevokedToken(Base):
+    ''' Token (access or refresh) revoked before its expiry, e.g. by logout.
+    Rows are useless once `expires_at` has passed and are purged then. '''
+    __tablename__ = "revoked_tokens"
+
+    id = Column(Integer, primary_key=True)  # also the sync cursor of utils/revocation.py
+    jti = Column(String, unique=True, nullable=False)
+    expires_at = Column(Integer, nullable=False, index=True)  # unix time, the token's exp
+
+    # the sync cursor must only grow: without AUTOINCREMENT SQLite reuses the ids of
+    # purged rows, and workers already past them would never load the new revocations
+    __table_args__ = {"sqlite_autoincrement": True}
+
+
+class Job(Base):
+    ''' Long-running work done in the background by utils/jobs.py, e.g. a cascading delete '''
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)  # name of the handler that runs it
+    payload = Column(JSON, nullable=False)  # keyword arguments of the handler
+    status = Column(String, nullable=False, default="queued")  # queued, running, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    result = Column(JSON)  # progress while running, outcome once done
+    error = Column(String)
+    # unix times; a running job whose lease has passed is picked up again
+    locked_until = Column(Integer)
+    created_at = Column(Integer, nullable=False)
+    updated_at = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        # workers look for the oldest claimable job
+        Index("ix_jobs_status_id", "status", "id"),
+    )
+
+
+class TaskStat(Base):
+    ''' Number of tasks of a user per status and priority, kept current by triggers on `tasks`,
+    so per-user and per-company statistics never scan the tasks themselves '''
+    __tablename__ = "task_stats"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    status = Column(Integer, nullable=False)  # 1 completed, 0 not
+    priority = Column(Integer)
+    task_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # one row per bucket; NULL priorities share a bucket too
+        Index("ux_task_stats_bucket", "user_id", "status", func.coalesce(priority, -1), unique=True),
+    )
+
+
+# Full-text search over task summary and description.
+# SQLite: an FTS5 table indexing `tasks` (external content), kept in sync by triggers.
+# Postgres: a GIN index on the same tsvector expression the search query uses.
+TASK_SEARCH_VECTOR = "to_tsvector('english', coalesce(summary, '') || ' ' || coalesce(description, ''))"
+
+TASK_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5("
+    "summary, description, content='tasks', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS tasks_fts_ai AFTER INSERT ON tasks BEGIN "
+    "INSERT INTO tasks_fts(rowid, summary, description) VALUES (new.id, new.summary, new.description); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS tasks_fts_ad AFTER DELETE ON tasks BEGIN "
+    "INSERT INTO tasks_fts(tasks_fts, rowid, summary, description) "
+    "VALUES ('delete', old.id, old.summary, old.description); "
+    "END",
+    # only fires when the text columns change, status/priority updates skip it
+    "CREATE TRIGGER IF NOT EXISTS tasks_fts_au AFTER UPDATE OF summary, description ON tasks BEGIN "
+    "INSERT INTO tasks_fts(tasks_fts, rowid, summary, description) "
+    "VALUES ('delete', old.id, old.summary, old.description); "
+    "INSERT INTO tasks_fts(rowid, summary, description) VALUES (new.id, new.summary, new.description); "
+    "END",
+]
+
+for statement in TASK_FTS_DDL:
+    event.listen(Task.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(
+    Task.__table__, "before_drop", DDL("DROP TABLE IF EXISTS tasks_fts").execute_if(dialect="sqlite")
+)
+event.listen(
+    Task.__table__,
+    "after_create",
+    DDL(f"CREATE INDEX IF NOT EXISTS ix_tasks_search ON tasks USING gin ({TASK_SEARCH_VECTOR})")
+    .execute_if(dialect="postgresql"),
+)
+
+
+# Task statistics: each task write moves one count between buckets of task_stats.
+# SQLite runs the statements from triggers, Postgres from a trigger function. A task
+# without a user matches no bucket to remove from and adds to none.
+TASK_STATUS_BUCKET = "CASE WHEN lower(coalesce({row}.status, '')) IN ('1', 'true', 't') THEN 1 ELSE 0 END"
+TASK_STATS_REMOVE = (
+    "UPDATE task_stats SET task_count = task_count - 1 WHERE user_id = old.user_id "
+    f"AND status = {TASK_STATUS_BUCKET.format(row='old')} "
+    "AND coalesce(priority, -1) = coalesce(old.priority, -1)"
+)
+TASK_STATS_ADD = (
+    "INSERT INTO task_stats (user_id, status, priority, task_count) "
+    f"SELECT new.user_id, {TASK_STATUS_BUCKET.format(row='new')}, new.priority, 1 "
+    "WHERE new.user_id IS NOT NULL "
+    "ON CONFLICT (user_id, status, coalesce(priority, -1)) "
+    "DO UPDATE SET task_count = task_stats.task_count + 1"
+)
+
+TASK_STATS_SQLITE_DDL = [
+    f"CREATE TRIGGER IF NOT EXISTS task_stats_ai AFTER INSERT ON tasks BEGIN {TASK_STATS_ADD}; END",
+    f"CREATE TRIGGER IF NOT EXISTS task_stats_ad AFTER DELETE ON tasks BEGIN {TASK_STATS_REMOVE}; END",
+    # only fires when a bucket column changes
+    "CREATE TRIGGER IF NOT EXISTS task_stats_au AFTER UPDATE OF user_id, status, priority ON tasks BEGIN "
+    f"{TASK_STATS_REMOVE}; {TASK_STATS_ADD}; END",
+]
+
+TASK_STATS_POSTGRES_DDL = [
+    "CREATE OR REPLACE FUNCTION task_stats_sync() RETURNS trigger AS $$ BEGIN "
+    f"IF TG_OP <> 'INSERT' THEN {TASK_STATS_REMOVE}; END IF; "
+    f"IF TG_OP <> 'DELETE' THEN {TASK_STATS_ADD}; END IF; "
+    "RETURN NULL; END $$ LANGUAGE plpgsql",
+    "CREATE TRIGGER task_stats_sync AFTER INSERT OR DELETE OR UPDATE OF user_id, status, priority ON tasks "
+    "FOR EACH ROW EXECUTE FUNCTION task_stats_sync()",
+]
+
+for statement in TASK_STATS_SQLITE_DDL:
+    event.listen(Task.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in TASK_STATS_POSTGRES_DDL:
+    event.listen(Task.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
@@ -1,34 +1,84 @@
 '''Authentication Router: Handles user login and token generation'''
 from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.base import User
 from schemas import auth as schemas_auth
-from utils.auth_user import authenticate_user, create_access_token
+from utils.auth_user import (
+    access_token_claims, authenticate_user, create_access_token, create_refresh_token,
+    credentials_exception, decode_token, get_current_principal, principal_claims
+)
 from database import get_db
+from utils.profiling import ProfiledRoute
+from utils.rate_limit import login_rate_limiter
+from utils.revocation import revocation_list
 
 
 router = APIRouter(
     prefix="/login",
     tags=["login"],
-    responses={404: {"description": "Not found"}}
+    responses={404: {"description": "Not found"}},
+    route_class=ProfiledRoute,
 )
 
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+def issue_tokens(user) -> dict:
+    ''' A fresh access token and refresh token pair for `user` '''
+    access_token = create_access_token(
+        data=principal_claims(user),
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {"access_token": access_token, "refresh_token": create_refresh_token(user), "token_type": "bearer"}
+
 # login endpoint
 @router.post("/", response_model=schemas_auth.Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(),db: Session = Depends(get_db)):
-    ''' User login to get access token '''
-    user = authenticate_user(db, form_data.username, form_data.password)
+async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends(),db: AsyncSession = Depends(get_db)):
+    ''' User login to get access token, throttled per username and client IP '''
+    await login_rate_limiter.check(form_data.username, request.client.host if request.client else None)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=400,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(
-        data={"sub": user.username},
-        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return issue_tokens(user)
+#==========================
+
+# refresh endpoint
+@router.post("/refresh", response_model=schemas_auth.Token)
+async def refresh(body: schemas_auth.RefreshRequest, db: AsyncSession = Depends(get_db)):
+    ''' Exchange a refresh token for new tokens, no password check.
+    The refresh token is single use: it is revoked once exchanged '''
+    payload = decode_token(body.refresh_token, token_type="refresh")
+    user = await db.get(User, payload.get("uid"))
+    if user is None:
+        raise credentials_exception()
+    # claim the token before issuing new ones: a replay, concurrent or on another
+    # worker that has not synced yet, loses on the unique jti
+    if not await revocation_list.revoke(db, payload["jti"], payload["exp"]):
+        raise credentials_exception()
+    return issue_tokens(user)
+#==========================
+
+# logout endpoint
+@router.post("/logout")
+async def logout(
+    body: Optional[schemas_auth.RefreshRequest] = None,
+    payload: dict = Depends(access_token_claims),
+    principal: schemas_auth.Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+    ):
+    ''' Revoke the bearer access token, and the refresh token if one is sent '''
+    if body is not None:
+        refresh_payload = decode_token(body.refresh_token, token_type="refresh")
+        if refresh_payload["sub"] != principal.username:
+            raise credentials_exception()
+        await revocation_list.revoke(db, refresh_payload["jti"], refresh_payload["exp"])
+    if "jti" in payload:
+        await revocation_list.revoke(db, payload["jti"], payload["exp"])
+    return {"message": "Logged out successfully"}
+#==========================
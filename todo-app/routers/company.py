@@ -1,72 +1,164 @@
 '''Company Router: Handles CRUD operations for Company entity'''
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
-from models.base import Company
-from schemas import company as schemas_company
-from database import get_db
+from models.base import Company, User
+from schemas import company as schemas_company, expanded as schemas_expanded, task as schemas_task
+from schemas.pagination import Page
+from database import get_db, get_read_db, is_replica
+from utils.cascades import delete_company as delete_company_job
+from utils.expand import Expand, expanded, loader_options
+from utils.jobs import accepted, job_queue
+from utils.pagination import PageParams, paginate
+from utils.profiling import ProfiledRoute
+from utils.response_cache import response_cache
+from utils.streaming import ndjson_export
+from utils.task_stats import company_stats
+from utils.writes import patch_returning, write_returning
 
 router = APIRouter(
     prefix="/companies",
     tags=["companies"],
-    responses={404: {"description": "Not found"}}
+    responses={404: {"description": "Not found"}},
+    route_class=ProfiledRoute,
 )
 
+expand_company = Expand(users="users")
+
 # Create Company
 @router.post("/", response_model=schemas_company.Company,status_code=status.HTTP_200_OK)
-async def create_company(company: schemas_company.CompanyCreate, db: Session = Depends(get_db)):
+async def create_company(company: schemas_company.CompanyCreate, db: AsyncSession = Depends(get_db)):
     ''' Create a new company first before creating users '''
-    db_company = db.query(Company).filter(Company.name == company.name).first()
-    if db_company:
-        raise HTTPException(400, detail="Company name already exists")
-
-    new_company = Company(
-        name=company.name,
-        description=company.description,
-        mode=company.mode,
-        rating=company.rating
+    new_company = await write_returning(
+        db,
+        insert(Company).values(**company.model_dump()).returning(Company),
+        {Company.name: "Company name already exists"},
     )
-    db.add(new_company)
-    db.commit()
-    db.refresh(new_company)
+    await response_cache.invalidate("companies")
     return new_company
 #==========================
 
 # List Companies
-@router.get("/", response_model=list[schemas_company.Company])
-async def list_companies(db: Session = Depends(get_db)):
-    ''' List all companies '''
-    return db.query(Company).all()
+@router.get("/", response_model=Page[schemas_expanded.CompanyExpanded], response_model_exclude_unset=True)
+async def list_companies(
+    request: Request,
+    page: PageParams = Depends(),
+    expand: set[str] = Depends(expand_company),
+    db: AsyncSession = Depends(get_read_db)
+    ):
+    ''' List companies, one page at a time ordered by ID, cached and revalidated with ETag.
+    `expand=users` embeds each company's users '''
+    async def produce():
+        stmt = select(Company).options(*loader_options(Company, expand))
+        result = await paginate(db, stmt, Company, page)
+        result["items"] = [expanded(company, expand) for company in result["items"]]
+        return result
+    return await response_cache.respond(
+        request,
+        ["companies", *expand_company.entities_for(expand)],
+        Page[schemas_expanded.CompanyExpanded],
+        produce,
+        exclude_unset=True,
+        store=not is_replica(db),
+    )
+#==========================
+
+# Export Companies
+@router.get("/export", response_class=StreamingResponse)
+async def export_companies(db: AsyncSession = Depends(get_read_db)):
+    ''' Stream all companies as NDJSON, one company per line '''
+    return ndjson_export(db, Company, schemas_company.Company)
+#==========================
+
+# Get Company by ID
+@router.get("/{company_id}", response_model=schemas_expanded.CompanyExpanded, response_model_exclude_unset=True)
+async def get_company(
+    company_id: int,
+    expand: set[str] = Depends(expand_company),
+    db: AsyncSession = Depends(get_read_db)
+    ):
+    ''' Get company details by Company ID, `expand=users` embeds its users '''
+    db_company = await db.get(Company, company_id, options=loader_options(Company, expand))
+    if not db_company:
+        raise HTTPException(404, detail="Company ID not found")
+    return expanded(db_company, expand)
+#==========================
+
+# Get Company Task Stats
+@router.get("/{company_id}/stats", response_model=schemas_task.TaskStats)
+async def get_company_stats(company_id: int, db: AsyncSession = Depends(get_read_db)):
+    ''' Task counts of the company's users, in total and per priority, read from task_stats '''
+    if await db.get(Company, company_id) is None:
+        raise HTTPException(404, detail="Company ID not found")
+    return await company_stats(db, company_id)
 #==========================
 
 # Update Company
 @router.put("/{company_id}", response_model=schemas_company.Company,status_code=status.HTTP_200_OK)
-def update_company(
+async def update_company(
     company_id: int,
     company: schemas_company.CompanyUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
     ):
     ''' Update company details '''
-    db_company = db.query(Company).filter(Company.id == company_id).first()
+    db_company = await write_returning(
+        db,
+        update(Company).where(Company.id == company_id)
+        .values(**company.model_dump(), version=Company.version + 1).returning(Company),
+        {Company.name: "Company name already exists"},
+    )
+    if not db_company:
+        raise HTTPException(404, detail="Company ID not found")
+    await response_cache.invalidate("companies")
+    return db_company
+#==========================
+
+# Patch Company
+@router.patch("/{company_id}", response_model=schemas_company.Company, status_code=status.HTTP_200_OK)
+async def patch_company(
+    company_id: int,
+    company: schemas_company.CompanyPatch,
+    db: AsyncSession = Depends(get_db)
+    ):
+    ''' Change only the fields sent. Send the `version` you read to fail
+    with 409 instead of overwriting a concurrent change '''
+    db_company = await patch_returning(
+        db, Company, company_id, company.model_dump(exclude_unset=True, exclude={"version"}), company.version,
+        {Company.name: "Company name already exists"},
+    )
     if not db_company:
         raise HTTPException(404, detail="Company ID not found")
-    for key, value in company.model_dump().items():
-        setattr(db_company, key, value)
-    db.commit()
-    db.refresh(db_company)
+    await response_cache.invalidate("companies")
     return db_company
 #==========================
 
+async def delete_company_later(db: AsyncSession, response: Response, company_id: int):
+    ''' Queue the deletion of a company with users, answered with 202 '''
+    job = await job_queue.enqueue(db, delete_company_job, company_id=company_id)
+    return accepted(response, job, f"Company ID: {company_id} and its users are being deleted")
+
 # Delete Company
 @router.delete("/{company_id}", status_code=status.HTTP_200_OK)
-def delete_company(company_id: int, db: Session = Depends(get_db)):
-    ''' Delete a company with ID'''
-    db_company = db.query(Company).filter(Company.id == company_id).first()
+async def delete_company(company_id: int, response: Response, db: AsyncSession = Depends(get_db)):
+    ''' Delete a company with ID. One with users is deleted along with them and
+    their tasks by a background job: 202 with the job to follow '''
+    db_company = await db.get(Company, company_id)
     company_name = db_company.name if db_company else "N/A"
     if not db_company:
         raise HTTPException(404, detail="Company ID not found")
-    db.delete(db_company)
-    db.commit()
+    if await db.scalar(select(User.id).where(User.company_id == company_id).limit(1)) is not None:
+        return await delete_company_later(db, response, company_id)
+    try:
+        await db.execute(delete(Company).where(Company.id == company_id))
+        await db.commit()
+    except IntegrityError:
+        # a user joined since the check
+        await db.rollback()
+        return await delete_company_later(db, response, company_id)
+    await response_cache.invalidate("companies")
     return {"message": f"Company ID: {company_id}, name: `{company_name}` \
             has been deleted successfully"}
 #==========================
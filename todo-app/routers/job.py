@@ -0,0 +1,25 @@
+'''Job Router: Reports the state of background jobs'''
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db
+from models.base import Job
+from schemas import job as schemas_job
+from utils.profiling import ProfiledRoute
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["jobs"],
+    responses={404: {"description": "Not found"}},
+    route_class=ProfiledRoute,
+)
+
+# Get Job by ID
+@router.get("/{job_id}", response_model=schemas_job.Job)
+async def get_job(job_id: int, db: AsyncSession = Depends(get_db)):
+    ''' Get the status, progress and outcome of a background job '''
+    # read from the primary: a replica may not have seen the job yet
+    job = await db.get(Job, job_id)
+    if not job:
+        raise HTTPException(404, detail="Job ID not found")
+    return job
+#==========================
@@ -0,0 +1,15 @@
+'''Metrics Router: Exposes request and database metrics for Prometheus'''
+from fastapi import APIRouter
+from fastapi.responses import Response
+from utils.metrics import CONTENT_TYPE, registry
+
+router = APIRouter(
+    tags=["metrics"],
+)
+
+# Metrics
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    ''' Current metrics in the Prometheus text exposition format '''
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
+#==========================
@@ -1,81 +1,270 @@
 '''Task Router: Handles CRUD operations for Task entity'''
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from typing import Annotated
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
+from config import settings
 from models.base import Task, User
-from schemas import task as schemas_task
-from database import get_db
+from schemas import task as schemas_task, expanded as schemas_expanded, job as schemas_job
+from schemas.pagination import Page
+from database import get_db, get_read_db, is_replica
+from utils.cascades import reassign_tasks as reassign_tasks_job
+from utils.expand import Expand, expanded, loader_options
+from utils.jobs import accepted, job_queue
+from utils.fast_json import ORJSONResponse, schema_columns
+from utils.pagination import PageParams, decode_cursor, encode_cursor, paginate
+from utils.profiling import ProfiledRoute
+from utils.response_cache import response_cache
+from utils.search import find_tasks
+from utils.streaming import ndjson_export
+from utils.writes import patch_returning, write_returning
 
 router = APIRouter(
     prefix="/tasks",
     tags=["tasks"],
-    responses={404: {"description": "Not found"}}
+    responses={404: {"description": "Not found"}},
+    route_class=ProfiledRoute,
 )
 
+expand_task = Expand(user="users")
+
 # Create Task
 
 @router.post("/", response_model=schemas_task.Task,status_code=status.HTTP_200_OK)
-async def create_task(task: schemas_task.TaskCreate, db: Session = Depends(get_db)):
-    ''' Create a new task and ensure the user exists '''
-    # check user exists
-    db_user = db.query(User).filter(User.id == task.user_id).first()
-    if not db_user:
-        raise HTTPException(400, detail="User does not exist")
-    db_task = Task(**task.model_dump())
-    if not db_task:
-        raise HTTPException(400, detail="task not exists")
-
-    db.add(db_task)
-    db.commit()
-    db.refresh(db_task)
+async def create_task(task: schemas_task.TaskCreate, db: AsyncSession = Depends(get_db)):
+    ''' Create a new task, the user must exist '''
+    db_task = await write_returning(
+        db,
+        insert(Task).values(**task.model_dump()).returning(Task),
+        {Task.user_id: "User does not exist"},
+    )
+    await response_cache.invalidate("tasks")
     return db_task
 #==========================
 
+async def existing_ids(db: AsyncSession, model, ids) -> set[int]:
+    ''' Which of `ids` exist in the table of `model`, in a single IN query '''
+    if not ids:
+        return set()
+    result = await db.execute(select(model.id).where(model.id.in_(set(ids))))
+    return set(result.scalars().all())
+
+# Bulk Create Tasks
+@router.post("/bulk", response_model=list[schemas_task.BulkItemResult], status_code=status.HTTP_200_OK)
+async def create_tasks_bulk(
+    tasks: list[schemas_task.TaskCreate] = Body(..., max_length=schemas_task.MAX_BULK_ITEMS),
+    db: AsyncSession = Depends(get_db)
+    ):
+    ''' Create many tasks in one transaction, skipping those whose user does not exist '''
+    users = await existing_ids(db, User, [task.user_id for task in tasks])
+    results = [schemas_task.BulkItemResult(index=i, ok=False, detail="User does not exist")
+               for i in range(len(tasks))]
+    valid = [i for i, task in enumerate(tasks) if task.user_id in users]
+    if valid:
+        # one multi-row INSERT ... RETURNING instead of an INSERT + SELECT per task
+        new_ids = await db.scalars(
+            insert(Task).returning(Task.id, sort_by_parameter_order=True),
+            [tasks[i].model_dump() for i in valid],
+        )
+        for i, task_id in zip(valid, new_ids.all()):
+            results[i] = schemas_task.BulkItemResult(index=i, id=task_id, ok=True)
+    await db.commit()
+    await response_cache.invalidate("tasks")
+    return results
+#==========================
+
+# Bulk Update Tasks
+@router.patch("/bulk", response_model=list[schemas_task.BulkItemResult], status_code=status.HTTP_200_OK)
+async def update_tasks_bulk(
+    tasks: list[schemas_task.TaskBulkUpdate] = Body(..., max_length=schemas_task.MAX_BULK_ITEMS),
+    db: AsyncSession = Depends(get_db)
+    ):
+    ''' Update many tasks in one transaction, only the fields sent for each task change '''
+    found = await existing_ids(db, Task, [task.id for task in tasks])
+    users = await existing_ids(db, User, [task.user_id for task in tasks if task.user_id is not None])
+    results, rows = [], []
+    for i, task in enumerate(tasks):
+        if task.id not in found:
+            results.append(schemas_task.BulkItemResult(index=i, id=task.id, ok=False, detail="task not exists"))
+        elif task.user_id is not None and task.user_id not in users:
+            results.append(schemas_task.BulkItemResult(index=i, id=task.id, ok=False, detail="User does not exist"))
+        else:
+            results.append(schemas_task.BulkItemResult(index=i, id=task.id, ok=True))
+            rows.append(task.model_dump(exclude_unset=True))
+    if rows:
+        # bulk UPDATE by primary key, executed as executemany
+        await db.execute(update(Task), rows)
+        await db.execute(
+            update(Task).where(Task.id.in_([row["id"] for row in rows])).values(version=Task.version + 1)
+        )
+    await db.commit()
+    await response_cache.invalidate("tasks")
+    return results
+#==========================
+
+# Bulk Delete Tasks
+@router.delete("/bulk", response_model=list[schemas_task.BulkItemResult], status_code=status.HTTP_200_OK)
+async def delete_tasks_bulk(
+    body: schemas_task.TaskBulkDelete,
+    db: AsyncSession = Depends(get_db)
+    ):
+    ''' Delete many tasks with one DELETE ... WHERE id IN (...) '''
+    deleted = set()
+    if body.ids:
+        result = await db.execute(delete(Task).where(Task.id.in_(set(body.ids))).returning(Task.id))
+        deleted = set(result.scalars().all())
+    await db.commit()
+    await response_cache.invalidate("tasks")
+    return [
+        schemas_task.BulkItemResult(index=i, id=task_id, ok=True) if task_id in deleted
+        else schemas_task.BulkItemResult(index=i, id=task_id, ok=False, detail="Task ID not found")
+        for i, task_id in enumerate(body.ids)
+    ]
+#==========================
+
+# Reassign Tasks
+@router.post("/reassign", response_model=schemas_job.JobAccepted, status_code=status.HTTP_202_ACCEPTED)
+async def reassign_tasks(body: schemas_task.TaskReassign, response: Response, db: AsyncSession = Depends(get_db)):
+    ''' Move all tasks of one user to another in a background job, follow it at the Location URL '''
+    if body.from_user_id == body.to_user_id:
+        raise HTTPException(400, detail="Tasks can only be reassigned to another user")
+    if await db.get(User, body.to_user_id) is None:
+        raise HTTPException(400, detail="User does not exist")
+    job = await job_queue.enqueue(db, reassign_tasks_job, from_user_id=body.from_user_id, to_user_id=body.to_user_id)
+    return accepted(response, job, f"Tasks of user ID: {body.from_user_id} are being reassigned")
+#==========================
+
 # List Tasks
-@router.get("/", response_model=list[schemas_task.Task])
-async def list_tasks(db: Session = Depends(get_db)):
-    ''' List all tasks '''
-    return db.query(Task).all()
+@router.get("/", response_model=Page[schemas_expanded.TaskExpanded], response_model_exclude_unset=True)
+async def list_tasks(
+    filters: Annotated[schemas_task.TaskFilter, Query()],
+    page: PageParams = Depends(),
+    expand: set[str] = Depends(expand_task),
+    db: AsyncSession = Depends(get_read_db)
+    ):
+    ''' List tasks matching the filters, one page at a time, `expand=user` embeds each task's user '''
+    # fast path: plain column rows straight to orjson, no ORM objects and no validation
+    fast = settings.FAST_LIST_RESPONSES and not expand
+    if fast:
+        stmt = select(*schema_columns(Task, schemas_task.Task))
+    else:
+        stmt = select(Task).options(*loader_options(Task, expand))
+    if filters.user_id is not None:
+        stmt = stmt.where(Task.user_id == filters.user_id)
+    if filters.status is not None:
+        stmt = stmt.where(Task.status == filters.status)
+    if filters.priority_min is not None:
+        stmt = stmt.where(Task.priority >= filters.priority_min)
+    if filters.priority_max is not None:
+        stmt = stmt.where(Task.priority <= filters.priority_max)
+    if filters.company_id is not None:
+        stmt = stmt.join(User, Task.user_id == User.id).where(User.company_id == filters.company_id)
+    descending = filters.sort.startswith("-")
+    sort_column = Task.priority if filters.sort.lstrip("-") == "priority" else None
+    result = await paginate(db, stmt, Task, page, sort_column=sort_column, descending=descending, mappings=fast)
+    if fast:
+        result["items"] = [dict(row) for row in result["items"]]
+        return ORJSONResponse(result)
+    result["items"] = [expanded(task, expand) for task in result["items"]]
+    return result
+#==========================
+
+# Export Tasks
+@router.get("/export", response_class=StreamingResponse)
+async def export_tasks(db: AsyncSession = Depends(get_read_db)):
+    ''' Stream all tasks as NDJSON, one task per line '''
+    return ndjson_export(db, Task, schemas_task.Task)
+#==========================
+
+# Search Tasks
+@router.get("/search", response_model=Page[schemas_task.Task])
+async def search_tasks(
+    q: str = Query(..., min_length=1, max_length=200, description="Words to look for"),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_read_db)
+    ):
+    ''' Full-text search over task summary and description, best match first.
+    The cursor holds an offset: ranking is computed per query so there is no
+    index order to seek on, and relevance results are rarely paged deeply '''
+    offset = 0
+    if page.after is not None:
+        values = decode_cursor(page.after)
+        if len(values) != 1 or not isinstance(values[0], int) or values[0] < 0:
+            raise HTTPException(400, detail="Invalid cursor")
+        offset = values[0]
+    rows = await find_tasks(db, q, page.limit + 1, offset)
+    next_cursor = encode_cursor([offset + page.limit]) if len(rows) > page.limit else None
+    return {"items": rows[:page.limit], "next_cursor": next_cursor}
 #==========================
 
 # Get All Task by User ID
 @router.get("/user/{user_id}", response_model=list[schemas_task.Task])
-async def get_tasks_by_user_id(user_id: int, db: Session = Depends(get_db)):
-    ''' Get all tasks by User ID '''
-    return db.query(Task).filter(Task.user_id == user_id).all()
+async def get_tasks_by_user_id(user_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    ''' Get all tasks by User ID, cached and revalidated with ETag '''
+    async def produce():
+        result = await db.execute(select(Task).where(Task.user_id == user_id))
+        return result.scalars().all()
+    return await response_cache.respond(
+        request, ["tasks"], list[schemas_task.Task], produce, store=not is_replica(db)
+    )
 #==========================
 
 # Get Task by ID
-@router.get("/{task_id}", response_model=schemas_task.Task, status_code=status.HTTP_200_OK)
-async def get_task(task_id: int, db: Session = Depends(get_db)):
-    ''' Get task details by Task ID '''
-    db_task = db.query(Task).filter(Task.id == task_id).first()
+@router.get("/{task_id}", response_model=schemas_expanded.TaskExpanded, response_model_exclude_unset=True,
+            status_code=status.HTTP_200_OK)
+async def get_task(
+    task_id: int,
+    expand: set[str] = Depends(expand_task),
+    db: AsyncSession = Depends(get_read_db)
+    ):
+    ''' Get task details by Task ID, `expand=user` embeds its user '''
+    db_task = await db.get(Task, task_id, options=loader_options(Task, expand))
     if not db_task:
         raise HTTPException(404, detail="task not exists")
-    return db_task
+    return expanded(db_task, expand)
 
 # Update Task
 @router.put("/{task_id}", response_model=schemas_task.Task,status_code=status.HTTP_200_OK)
-def update_task(task_id: int, task: schemas_task.TaskUpdate, db: Session = Depends(get_db)):
+async def update_task(task_id: int, task: schemas_task.TaskUpdate, db: AsyncSession = Depends(get_db)):
     ''' Update task details '''
-    db_task = db.query(Task).filter(Task.id == task_id).first()
+    db_task = await write_returning(
+        db,
+        update(Task).where(Task.id == task_id)
+        .values(**task.model_dump(), version=Task.version + 1).returning(Task),
+        {Task.user_id: "User does not exist"},
+    )
     if not db_task:
         raise HTTPException(400, detail="task not exists")
-    for key, value in task.model_dump().items():
-        setattr(db_task, key, value)
-    db.commit()
-    db.refresh(db_task)
+    await response_cache.invalidate("tasks")
+    return db_task
+#==========================
+
+# Patch Task
+@router.patch("/{task_id}", response_model=schemas_task.Task, status_code=status.HTTP_200_OK)
+async def patch_task(task_id: int, task: schemas_task.TaskPatch, db: AsyncSession = Depends(get_db)):
+    ''' Change only the fields sent, e.g. `{"status": true}`. Send the `version`
+    you read to fail with 409 instead of overwriting a concurrent change '''
+    db_task = await patch_returning(
+        db, Task, task_id, task.model_dump(exclude_unset=True, exclude={"version"}), task.version,
+        {Task.user_id: "User does not exist"},
+    )
+    if not db_task:
+        raise HTTPException(404, detail="Task ID not found")
+    await response_cache.invalidate("tasks")
     return db_task
 #==========================
 
 # Delete Task
 @router.delete("/{task_id}", status_code=status.HTTP_200_OK)
-def delete_task(task_id: int, db: Session = Depends(get_db)):
+async def delete_task(task_id: int, db: AsyncSession = Depends(get_db)):
     ''' Delete a task with ID'''
-    db_task = db.query(Task).filter(Task.id == task_id).first()
+    db_task = await db.get(Task, task_id)
     if not db_task:
         raise HTTPException(404, detail="Task ID not found")
-    db.delete(db_task)
-    db.commit()
+    await db.delete(db_task)
+    await db.commit()
+    await response_cache.invalidate("tasks")
     return {"message": f"Task ID: {task_id} has been deleted successfully"}
 #==========================
@@ -1,63 +1,88 @@
 '''User Router: Handles CRUD operations for User entity'''
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import case, delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
-from database import get_db
-from models.base import User, Company
-from schemas import user as schemas_user
-from utils.auth_user import get_current_user
+from database import get_db, get_read_db, is_replica
+from models.base import Task, User
+from schemas import user as schemas_user, expanded as schemas_expanded, task as schemas_task
+from schemas.pagination import Page
+from utils.auth_user import CLAIM_FIELDS, get_current_user
+from utils.cascades import delete_user as delete_user_job
+from utils.expand import Expand, expanded, loader_options
+from utils.jobs import accepted, job_queue
+from utils.pagination import PageParams, paginate
+from utils.password import password_hasher
+from utils.profiling import ProfiledRoute
+from utils.response_cache import response_cache
+from utils.streaming import ndjson_export
+from utils.task_stats import user_stats
+from utils.user_cache import invalidate_user
+from utils.writes import write_returning
 
 router = APIRouter(
     prefix="/users",
     tags=["users"],
-    responses={404: {"description": "Not found"}}
+    responses={404: {"description": "Not found"}},
+    route_class=ProfiledRoute,
 )
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+expand_user = Expand(company="companies", tasks="tasks")
+
+# detail of the 400 returned when a write violates the constraint on each column
+USER_CONSTRAINTS = {
+    User.company_id: "Company does not exist",
+    User.username: "Username already registered",
+    User.email: "Email already registered",
+}
 
 # Create User
 @router.post("/", response_model=schemas_user.UserResponse,status_code=status.HTTP_200_OK)
-async def create_user(user: schemas_user.UserCreate, db: Session = Depends(get_db)):
-    ''' Create a new user who must belong to a company, 
+async def create_user(user: schemas_user.UserCreate, db: AsyncSession = Depends(get_db)):
+    ''' Create a new user who must belong to a company,
     and the email and username must be unique '''
-    # Check company first
-    db_company = db.query(Company).filter(Company.id == user.company_id).first()
-    if not db_company:
-        raise HTTPException(400, detail="Company does not exist")
-
-    # Check if user exists
-    db_user = db.query(User).filter(User.username == user.username).first()
-    if db_user:
-        raise HTTPException(400, detail="Username already registered")
-
-    # Check if email exists
-    db_email = db.query(User).filter(User.email == user.email).first()
-    if db_email:
-        raise HTTPException(400, detail="Email already registered")
-
-    hashed_pw = pwd_context.hash(user.password)
-    new_user = User(
-        username=user.username,
-        email=user.email,
-        password=hashed_pw,
-        first_name=user.first_name,
-        last_name=user.last_name,
-        is_active=user.is_active,
-        is_admin=user.is_admin,
-        company_id=user.company_id
-        )
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    hashed_pw = await password_hasher.hash(user.password)
+    new_user = await write_returning(
+        db,
+        insert(User).values(**user.model_dump(exclude={"password"}), password=hashed_pw).returning(User),
+        USER_CONSTRAINTS,
+    )
+    await response_cache.invalidate("users")
     return new_user
 #==========================
 
 # List Users
-@router.get("/", response_model=list[schemas_user.UserResponse])
-async def list_users(db: Session = Depends(get_db)):
-    ''' List all users '''
-    return db.query(User).all()
+@router.get("/", response_model=Page[schemas_expanded.UserExpanded], response_model_exclude_unset=True)
+async def list_users(
+    request: Request,
+    page: PageParams = Depends(),
+    expand: set[str] = Depends(expand_user),
+    db: AsyncSession = Depends(get_read_db)
+    ):
+    ''' List users, one page at a time ordered by ID, cached and revalidated with ETag.
+    `expand=company,tasks` embeds each user's company and tasks '''
+    async def produce():
+        stmt = select(User).options(*loader_options(User, expand))
+        result = await paginate(db, stmt, User, page)
+        result["items"] = [expanded(user, expand) for user in result["items"]]
+        return result
+    return await response_cache.respond(
+        request,
+        ["users", *expand_user.entities_for(expand)],
+        Page[schemas_expanded.UserExpanded],
+        produce,
+        exclude_unset=True,
+        store=not is_replica(db),
+    )
+#==========================
+
+# Export Users
+@router.get("/export", response_class=StreamingResponse)
+async def export_users(db: AsyncSession = Depends(get_read_db)):
+    ''' Stream all users as NDJSON, one user per line '''
+    return ndjson_export(db, User, schemas_user.UserResponse)
 #==========================
 
 # get me
@@ -68,37 +93,71 @@ async def get_me(current_user: schemas_user.User = Depends(get_current_user)):
 #==========================
 
 # Get User by ID
-@router.get("/{user_id}", response_model=schemas_user.UserResponse)
-async def get_user(user_id: int, db: Session = Depends(get_db)):
-    ''' Get user details by User ID '''
-    user = db.query(User).filter(User.id == user_id).first()
+@router.get("/{user_id}", response_model=schemas_expanded.UserExpanded, response_model_exclude_unset=True)
+async def get_user(
+    user_id: int,
+    expand: set[str] = Depends(expand_user),
+    db: AsyncSession = Depends(get_read_db)
+    ):
+    ''' Get user details by User ID, `expand=company,tasks` embeds related entities '''
+    user = await db.get(User, user_id, options=loader_options(User, expand))
     if not user:
         raise HTTPException(404, detail="User not found")
-    return user
+    return expanded(user, expand)
+#==========================
+
+# Get User Task Stats
+@router.get("/{user_id}/stats", response_model=schemas_task.TaskStats)
+async def get_user_stats(user_id: int, db: AsyncSession = Depends(get_read_db)):
+    ''' Task counts of the user, in total and per priority, read from task_stats '''
+    if await db.get(User, user_id) is None:
+        raise HTTPException(404, detail="User not found")
+    return await user_stats(db, user_id)
 #==========================
 
 # Update User
 @router.put("/{user_id}", response_model=schemas_user.UserResponse,status_code=status.HTTP_200_OK)
-def update_user(user_id: int, user: schemas_user.UserUpdate, db: Session = Depends(get_db)):
+async def update_user(user_id: int, user: schemas_user.UserUpdate, db: AsyncSession = Depends(get_db)):
     ''' Update user details '''
-    db_user = db.query(User).filter(User.id == user_id).first()
+    changes = {key: value for key, value in user.model_dump(exclude_unset=True).items() if value is not None}
+    if "password" in changes:
+        changes["password"] = await password_hasher.hash(changes["password"])
+    old_username = None
+    if "username" in changes:
+        # the cache is keyed by username, RETURNING only has the new one
+        old_username = await db.scalar(select(User.username).where(User.id == user_id))
+    stmt = update(User).where(User.id == user_id)
+    claims = [getattr(User, key).is_distinct_from(changes[key]) for key in CLAIM_FIELDS if key in changes]
+    if claims:
+        # tokens carrying the old claims are now stale, the database compares old and new values
+        stmt = stmt.values(token_version=case((or_(*claims), User.token_version + 1), else_=User.token_version))
+    if changes:
+        stmt = stmt.values(**changes)
+    else:
+        stmt = stmt.values(id=User.id)  # nothing to change, still report whether the user exists
+    db_user = await write_returning(db, stmt.returning(User), USER_CONSTRAINTS)
     if not db_user:
         raise HTTPException(404, detail="User not found")
-    for key, value in user.model_dump(exclude_unset=True).items():
-        if value is not None:
-            setattr(db_user, key, value)
-    db.commit()
-    db.refresh(db_user)
+    invalidate_user(old_username, db_user.username, user_id=db_user.id)
+    await response_cache.invalidate("users")
     return db_user
 #==========================
 
+async def delete_user_later(db: AsyncSession, response: Response, user_id: int):
+    ''' Queue the deletion of a user with tasks, answered with 202 '''
+    job = await job_queue.enqueue(db, delete_user_job, user_id=user_id)
+    return accepted(response, job, f"User ID: {user_id} and their tasks are being deleted")
+
 # Delete User
 @router.delete("/{user_id}", status_code=status.HTTP_200_OK)
-def delete_user(user_id: int, db: Session = Depends(get_db)):
-    ''' Delete a user with ID'''
-    db_user = db.query(User).filter(User.id == user_id).first()
+async def delete_user(user_id: int, response: Response, db: AsyncSession = Depends(get_db)):
+    ''' Delete a user with ID. One with tasks is deleted along with them by a
+    background job: 202 with the job to follow '''
+    db_user = await db.get(User, user_id)
     if not db_user:
         raise HTTPException(404, detail="User not found")
+    if await db.scalar(select(Task.id).where(Task.user_id == user_id).limit(1)) is not None:
+        return await delete_user_later(db, response, user_id)
     # Convert SQLAlchemy model to dict with proper type conversion
     user_dict = {
         "id": db_user.id,
@@ -111,8 +170,16 @@ def delete_user(user_id: int, db: Session = Depends(get_db)):
         "company_id": db_user.company_id
     }
     user_data = schemas_user.UserResponse(**user_dict)
-    db.delete(db_user)
-    db.commit()
+    # a DELETE statement, not db.delete(): the ORM would detach a task added since the
+    # check by nulling its user_id, the foreign key rejects the delete instead
+    try:
+        await db.execute(delete(User).where(User.id == user_id))
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        return await delete_user_later(db, response, user_id)
+    invalidate_user(db_user.username, user_id=user_id)
+    await response_cache.invalidate("users")
     return {
         "message": f"User ID: {user_id} has been deleted successfully",
         "user": user_data
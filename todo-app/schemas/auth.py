@@ -6,7 +6,20 @@ class Token(BaseModel):
     ''' Token model for access token response '''
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    ''' Refresh token to exchange, or to revoke on logout '''
+    refresh_token: str
 
 class TokenData(BaseModel):
     ''' Data contained in the token '''
     username: Optional[str] = None
+
+class Principal(BaseModel):
+    ''' The authenticated user as far as authorization is concerned '''
+    id: int
+    username: str
+    company_id: int
+    is_admin: bool
+    token_version: int
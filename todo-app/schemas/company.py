@@ -1,6 +1,6 @@
 ''' Schemas for Company operations '''
 from typing import Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 
 class CompanyBase(BaseModel):
     ''' Base properties for a Company '''
@@ -12,6 +12,7 @@ class CompanyBase(BaseModel):
 class Company(CompanyBase):
     ''' Company model with ID '''
     id: int
+    version: int = 0
     class ConfigDict:
         from_attributes=True
 
@@ -24,4 +25,17 @@ class CompanyUpdate(CompanyBase):
     name: Optional[str] = None
     description: Optional[str] = None
     mode: Optional[str] = None
-    rating: Optional[int] = None
\ No newline at end of file
+    rating: Optional[int] = None
+
+class CompanyPatch(CompanyUpdate):
+    ''' Fields to change on a company, only those sent are written '''
+    # the version the client read; when sent, the patch fails with 409 if the company changed since
+    version: Optional[int] = None
+
+    @field_validator("name")
+    @classmethod
+    def not_null(cls, value):
+        # may be left out, but a company always has a name
+        if value is None:
+            raise ValueError("may not be null")
+        return value
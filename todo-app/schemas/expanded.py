@@ -0,0 +1,18 @@
+''' Response schemas with related entities embedded, used with `?expand=` '''
+from typing import Optional
+from schemas.company import Company
+from schemas.task import Task
+from schemas.user import UserResponse
+
+class UserExpanded(UserResponse):
+    ''' User with its company and tasks, when requested '''
+    company: Optional[Company] = None
+    tasks: Optional[list[Task]] = None
+
+class CompanyExpanded(Company):
+    ''' Company with its users, when requested '''
+    users: Optional[list[UserResponse]] = None
+
+class TaskExpanded(Task):
+    ''' Task with its user, when requested '''
+    user: Optional[UserResponse] = None
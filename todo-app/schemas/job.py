@@ -0,0 +1,21 @@
+''' Schemas for background jobs '''
+from typing import Any, Optional
+from pydantic import BaseModel
+
+class Job(BaseModel):
+    ''' State of a background job, `result` holds its progress while it runs '''
+    id: int
+    kind: str
+    status: str  # queued, running, done, failed
+    attempts: int
+    result: Optional[dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: int
+    updated_at: int
+    class ConfigDict:
+        from_attributes=True
+
+class JobAccepted(BaseModel):
+    ''' Response of a request whose work was handed to a background job '''
+    message: str
+    job: Job
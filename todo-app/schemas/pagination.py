@@ -0,0 +1,10 @@
+''' Schemas shared by paginated list endpoints '''
+from typing import Generic, Optional, TypeVar
+from pydantic import BaseModel
+
+T = TypeVar("T")
+
+class Page(BaseModel, Generic[T]):
+    ''' One page of results and the cursor to fetch the next one '''
+    items: list[T]
+    next_cursor: Optional[str] = None
@@ -1,6 +1,9 @@
 ''' Schemas for Task operations '''
-from typing import Optional
-from pydantic import BaseModel
+from typing import Literal, Optional
+from pydantic import BaseModel, Field, field_validator
+
+# largest batch accepted by the bulk endpoints
+MAX_BULK_ITEMS = 1000
 
 class TaskBase(BaseModel):
     ''' Base properties for a Task '''
@@ -13,6 +16,8 @@ class Task(TaskBase):
     ''' Task model with ID and user association '''
     id: int
     user_id: int
+    priority: Optional[int] = None  # cleared by an update that sends null
+    version: int = 0
     class ConfigDict:
         from_attributes=True
         
@@ -27,3 +32,59 @@ class TaskUpdate(BaseModel):
     status: Optional[bool] = None
     priority: Optional[int] = None
     user_id: Optional[int] = None
+
+class TaskPatch(TaskUpdate):
+    ''' Fields to change on a task, only those sent are written '''
+    # the version the client read; when sent, the patch fails with 409 if the task changed since
+    version: Optional[int] = None
+
+    @field_validator("summary", "status", "user_id")
+    @classmethod
+    def not_null(cls, value):
+        # fields may be left out, but a task always has these
+        if value is None:
+            raise ValueError("may not be null")
+        return value
+
+class TaskReassign(BaseModel):
+    ''' Move every task of one user to another '''
+    from_user_id: int
+    to_user_id: int
+
+class TaskFilter(BaseModel):
+    ''' Query parameters to filter and sort the task list '''
+    status: Optional[bool] = None
+    priority_min: Optional[int] = None
+    priority_max: Optional[int] = None
+    user_id: Optional[int] = None
+    company_id: Optional[int] = None
+    # prefix with "-" for descending order
+    sort: Literal["id", "-id", "priority", "-priority"] = "id"
+
+class TaskBulkUpdate(TaskUpdate):
+    ''' Fields to change on one task of a bulk update, identified by ID '''
+    id: int
+
+class TaskBulkDelete(BaseModel):
+    ''' IDs of the tasks to delete in one request '''
+    ids: list[int] = Field(..., max_length=MAX_BULK_ITEMS)
+
+class BulkItemResult(BaseModel):
+    ''' Outcome of one item of a bulk request, in request order '''
+    index: int
+    id: Optional[int] = None
+    ok: bool
+    detail: Optional[str] = None
+
+class PriorityCount(BaseModel):
+    ''' Tasks of one priority, `null` for tasks without one '''
+    priority: Optional[int] = None
+    total: int
+    completed: int
+
+class TaskStats(BaseModel):
+    ''' Task counts of a user or a company '''
+    total: int = 0
+    completed: int = 0
+    open: int = 0
+    by_priority: list[PriorityCount] = []
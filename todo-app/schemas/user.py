@@ -16,6 +16,7 @@ class User(UserBase):
     ''' User model with ID and password '''
     password: str
     id: int
+    token_version: int = 0
     class ConfigDict:
         from_attributes=True
 
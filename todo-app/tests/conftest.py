@@ -1,31 +1,39 @@
+import asyncio
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
-from database import Base, get_db
+from database import Base, build_async_engine, build_engine, get_db
 from main import app
 from models.base import User, Company, Task
+from utils.metrics import track_pool
 from passlib.context import CryptContext
+from utils.rate_limit import login_rate_limiter
+from utils.response_cache import response_cache
+from utils.revocation import revocation_list
+from utils.user_cache import user_cache
 
 # Test database setup
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False}
-)
+engine = build_engine(SQLALCHEMY_DATABASE_URL)
 TestingSessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
     bind=engine
 )
+async_engine = build_async_engine(SQLALCHEMY_DATABASE_URL)
+TestingAsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+track_pool(async_engine.sync_engine, "test")
 
 
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
+async def override_get_db():
+    async with TestingAsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 app.dependency_overrides[get_db] = override_get_db
@@ -36,8 +44,14 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 @pytest.fixture(autouse=True, scope="function")
 def setup_database():
     Base.metadata.create_all(bind=engine)
+    user_cache.clear()
+    revocation_list.clear()
+    asyncio.run(response_cache.backend.clear())
+    asyncio.run(login_rate_limiter.backend.clear())
     yield
     Base.metadata.drop_all(bind=engine)
+    # pooled connections would keep state (FTS5 tables) of the schema just dropped
+    asyncio.run(async_engine.dispose())
 
 
 @pytest.fixture
@@ -1,70 +1,79 @@
+import asyncio
+import time
+from types import SimpleNamespace
 import pytest
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
 from utils.auth_user import (
     authenticate_user,
     create_access_token,
-    get_current_user
+    decode_token,
+    get_current_principal,
+    get_current_user,
+    principal_claims
 )
-from sqlalchemy.orm import Session
+from utils.jwt_keys import KeySet
+from utils.revocation import RevocationList
+from utils.user_cache import token_versions, user_cache
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.base import RevokedToken
 from fastapi import HTTPException
 from jose import JWTError
+from tests.conftest import TestingAsyncSessionLocal
+
+
+def mock_session(user):
+    # AsyncSession whose execute() returns a result yielding `user`
+    mock_db = AsyncMock(spec=AsyncSession)
+    mock_db.execute.return_value = Mock()
+    mock_db.execute.return_value.scalars.return_value.first.return_value = user
+    return mock_db
 
 
 def test_authenticate_user_valid_credentials():
     # Test successful authentication
-    mock_db = Mock(spec=Session)
     mock_user = Mock()
     mock_user.password = "hashed_password"
-
-    mock_db.query.return_value.filter.return_value.first.return_value = (
-        mock_user
-    )
+    mock_db = mock_session(mock_user)
     with patch('utils.auth_user.verify_password', return_value=True):
-        result = authenticate_user(mock_db, 'test_user', 'correct_password')
+        result = asyncio.run(authenticate_user(mock_db, 'test_user', 'correct_password'))
         assert result == mock_user
 
 
 def test_authenticate_user_invalid_username():
     # Test authentication with non-existent username
-    mock_db = Mock(spec=Session)
-    mock_db.query.return_value.filter.return_value.first.return_value = None
-    result = authenticate_user(mock_db, 'invalid_user', 'any_password')
+    mock_db = mock_session(None)
+    result = asyncio.run(authenticate_user(mock_db, 'invalid_user', 'any_password'))
     assert result is False
 
 
 def test_authenticate_user_wrong_password():
     # Test authentication with wrong password
-    mock_db = Mock(spec=Session)
     mock_user = Mock()
     mock_user.password = "hashed_password"
-
-    mock_db.query.return_value.filter.return_value.first.return_value = (
-        mock_user
-    )
+    mock_db = mock_session(mock_user)
 
     with patch('utils.auth_user.verify_password', return_value=False):
-        result = authenticate_user(mock_db, 'test_user', 'wrong_password')
+        result = asyncio.run(authenticate_user(mock_db, 'test_user', 'wrong_password'))
         assert result is False
 
 
 def test_authenticate_user_empty_credentials():
     # Test authentication with empty credentials
-    mock_db = Mock(spec=Session)
-    mock_db.query.return_value.filter.return_value.first.return_value = None
-    result = authenticate_user(mock_db, '', '')
+    mock_db = mock_session(None)
+    result = asyncio.run(authenticate_user(mock_db, '', ''))
     assert result is False
 
 
 def test_authenticate_user_special_characters():
     # Test authentication with special characters in credentials
-    mock_db = Mock(spec=Session)
     mock_user = Mock()
     mock_user.password = "hashed_password"
-    mock_db.query.return_value.filter.return_value.first.return_value = (
-        mock_user
-    )
+    mock_db = mock_session(mock_user)
     with patch('utils.auth_user.verify_password', return_value=True):
-        result = authenticate_user(mock_db, 'test@user!', 'pass#word$')
+        result = asyncio.run(authenticate_user(mock_db, 'test@user!', 'pass#word$'))
         assert result == mock_user
 
 
@@ -76,13 +85,103 @@ def test_create_access_token():
 
 
 def test_get_current_user_invalid_token():
-    mock_db = Mock(spec=Session)
+    mock_db = mock_session(None)
     with patch('utils.auth_user.jwt.decode', side_effect=JWTError):
         with pytest.raises(HTTPException) as exc_info:
-            import asyncio
             asyncio.run(get_current_user(
                 token="invalid.token.here",
                 db=mock_db
                 ))
         assert exc_info.value.status_code == 401
-        assert exc_info.value.detail == "Could not validate credentials"
\ No newline at end of file
+        assert exc_info.value.detail == "Could not validate credentials"
+
+
+def rsa_pem():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    public = key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+    return private, public
+
+
+def test_key_set_rotation():
+    old_private, old_public = rsa_pem()
+    new_private, _ = rsa_pem()
+    old_keys = KeySet("RS256", old_private)
+    rotated = KeySet("RS256", new_private, [old_public])
+    old_token = old_keys.encode({"sub": "someone"})
+    # tokens signed before the rotation stay valid, new ones use the new key
+    assert rotated.decode(old_token)["sub"] == "someone"
+    assert rotated.decode(rotated.encode({"sub": "other"}))["sub"] == "other"
+    with pytest.raises(JWTError):
+        old_keys.decode(rotated.encode({"sub": "other"}))
+
+
+def principal_user(**overrides):
+    fields = dict(
+        id=7, username="alice", email="alice@example.com", password="hashed", first_name="A",
+        last_name="B", is_active=True, is_admin=False, company_id=3, token_version=2,
+    )
+    fields.update(overrides)
+    return SimpleNamespace(**fields)
+
+
+def test_stateless_principal_needs_no_user_query(monkeypatch):
+    monkeypatch.setattr("config.settings.JWT_STATELESS", True)
+    token = create_access_token(principal_claims(principal_user()))
+    token_versions.set(7, 2)
+    mock_db = mock_session(None)
+    principal = asyncio.run(get_current_principal(payload=decode_token(token), db=mock_db))
+    assert (principal.id, principal.company_id, principal.is_admin) == (7, 3, False)
+    mock_db.execute.assert_not_awaited()
+    mock_db.scalar.assert_not_awaited()
+    token_versions.clear()
+
+
+def test_stateless_principal_reloads_stale_token(monkeypatch):
+    monkeypatch.setattr("config.settings.JWT_STATELESS", True)
+    token = create_access_token(principal_claims(principal_user()))
+    # an admin grant bumped the version after the token was issued
+    mock_db = mock_session(principal_user(is_admin=True, token_version=3))
+    mock_db.scalar.return_value = 3
+    principal = asyncio.run(get_current_principal(payload=decode_token(token), db=mock_db))
+    assert principal.is_admin is True
+    assert principal.token_version == 3
+    mock_db.execute.assert_awaited_once()
+    token_versions.clear()
+    user_cache.clear()
+
+
+def test_revocation_list_syncs_from_table():
+    expires_at = int(time.time()) + 60
+
+    async def run():
+        async with TestingAsyncSessionLocal() as db:
+            await RevocationList(5).revoke(db, "revoked-elsewhere", expires_at)
+            other_worker = RevocationList(5)
+            await other_worker.sync(db)
+            return other_worker
+    other_worker = asyncio.run(run())
+    assert other_worker.is_revoked("revoked-elsewhere")
+    assert not other_worker.is_revoked("never-revoked")
+
+
+def test_revocation_sync_sees_revocations_after_a_purge():
+    now = int(time.time())
+
+    async def run():
+        async with TestingAsyncSessionLocal() as db:
+            revoking_worker, other_worker = RevocationList(5), RevocationList(5)
+            await revoking_worker.revoke(db, "still-valid", now + 60)
+            await revoking_worker.revoke(db, "about-to-expire", now + 60)
+            await other_worker.sync(db)
+            # the newest row expires and is purged by the next revoke, its id must not come back
+            await db.execute(update(RevokedToken).where(RevokedToken.jti == "about-to-expire").values(expires_at=now))
+            await db.commit()
+            await revoking_worker.revoke(db, "stolen-token", now + 60)
+            await other_worker.sync(db)
+            return other_worker
+    assert asyncio.run(run()).is_revoked("stolen-token")
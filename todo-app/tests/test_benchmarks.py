@@ -0,0 +1,18 @@
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+
+APP_DIR = Path(__file__).parent.parent
+
+
+def test_micro_benchmarks_still_run():
+    # each benchmark once and untimed, so a schema change that breaks them fails here;
+    # in its own process, as importing benchmarks/ points DATABASE_URL at a bench database
+    pytest.importorskip("pytest_benchmark")
+    result = subprocess.run(
+        [sys.executable, "-m", "pytest", "benchmarks/", "--no-cov", "--benchmark-disable", "-q",
+         "-p", "no:cacheprovider"],
+        cwd=APP_DIR, capture_output=True, text=True,
+    )
+    assert result.returncode == 0, result.stdout[-3000:]
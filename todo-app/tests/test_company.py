@@ -30,7 +30,8 @@ def test_create_duplicate_company():
 def test_list_empty_companies():
     response = client.get("/companies/")
     assert response.status_code == 200
-    assert response.json() == []
+    assert response.json()["items"] == []
+    assert response.json()["next_cursor"] is None
 
 
 def test_list_companies():
@@ -39,7 +40,27 @@ def test_list_companies():
     client.post("/companies/", json={"name": "Company B"})
     response = client.get("/companies/")
     assert response.status_code == 200
-    assert len(response.json()) == 2
+    assert len(response.json()["items"]) == 2
+
+
+def test_list_companies_pagination():
+    for name in ["Company A", "Company B", "Company C"]:
+        client.post("/companies/", json={"name": name})
+    first = client.get("/companies/", params={"limit": 2}).json()
+    assert [c["name"] for c in first["items"]] == ["Company A", "Company B"]
+    assert first["next_cursor"] is not None
+    second = client.get(
+        "/companies/",
+        params={"limit": 2, "after": first["next_cursor"]}
+        ).json()
+    assert [c["name"] for c in second["items"]] == ["Company C"]
+    assert second["next_cursor"] is None
+
+
+def test_list_companies_invalid_cursor():
+    response = client.get("/companies/", params={"after": "not-a-cursor"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
 
 
 def test_update_company():
@@ -60,6 +81,21 @@ def test_update_nonexistent_company():
     assert response.status_code == 404
 
 
+def test_patch_company_keeps_other_fields():
+    company_id = client.post("/companies/", json={"name": "Patched", "rating": 4}).json()["id"]
+    response = client.patch(f"/companies/{company_id}", json={"description": "Now described"})
+    assert response.status_code == 200
+    assert response.json()["rating"] == 4
+    assert response.json()["version"] == 1
+    assert client.patch("/companies/999", json={"rating": 1}).status_code == 404
+
+
+def test_patch_company_rejects_null_name():
+    company_id = client.post("/companies/", json={"name": "Named"}).json()["id"]
+    assert client.patch(f"/companies/{company_id}", json={"name": None}).status_code == 422
+    assert client.get(f"/companies/{company_id}").json()["name"] == "Named"
+
+
 def test_delete_company():
     # Create company first
     create_response = client.post("/companies/", json={"name": "To Delete"})
@@ -72,4 +108,25 @@ def test_delete_company():
 
 def test_delete_nonexistent_company():
     response = client.delete("/companies/999")
-    assert response.status_code == 404
\ No newline at end of file
+    assert response.status_code == 404
+
+def test_list_companies_etag():
+    client.post("/companies/", json={"name": "Company A"})
+    first = client.get("/companies/")
+    etag = first.headers["etag"]
+    cached = client.get("/companies/", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    # a write changes the ETag
+    client.post("/companies/", json={"name": "Company B"})
+    fresh = client.get("/companies/", headers={"If-None-Match": etag})
+    assert fresh.status_code == 200
+    assert fresh.headers["etag"] != etag
+    assert len(fresh.json()["items"]) == 2
+
+
+def test_get_company_expand_users(test_user, test_company):
+    response = client.get(f"/companies/{test_company.id}", params={"expand": "users"})
+    assert response.status_code == 200
+    assert [u["username"] for u in response.json()["users"]] == ["testuser"]
+    assert client.get("/companies/999").status_code == 404
@@ -0,0 +1,155 @@
+import asyncio
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession
+from main import app
+from models.base import Company, Job, Task, User
+from tests.conftest import TestingAsyncSessionLocal, TestingSessionLocal
+from utils.jobs import JobQueue, job_queue
+
+client = TestClient(app)
+
+
+def run_jobs(queue=job_queue):
+    ''' Run queued jobs to completion, as the lifespan workers would '''
+    async def drain():
+        while await queue.run_next(TestingAsyncSessionLocal):
+            pass
+    asyncio.run(drain())
+
+
+def add_user_with_tasks(company_id, name, tasks):
+    with TestingSessionLocal() as db:
+        user = User(username=name, email=f"{name}@example.com", password="x", first_name="F",
+                    last_name="L", company_id=company_id)
+        db.add(user)
+        db.flush()
+        db.add_all([Task(summary=f"{name} {i}", priority=1, user_id=user.id) for i in range(tasks)])
+        db.commit()
+        return user.id
+
+
+def count(model, *conditions):
+    with TestingSessionLocal() as db:
+        return db.query(model).filter(*conditions).count()
+
+
+def test_delete_company_cascades_in_background(test_company, monkeypatch):
+    monkeypatch.setattr("config.settings.JOB_CHUNK_SIZE", 2)
+    add_user_with_tasks(test_company.id, "first", 3)
+    add_user_with_tasks(test_company.id, "second", 2)
+    response = client.delete(f"/companies/{test_company.id}")
+    assert response.status_code == 202
+    job_url = response.headers["Location"]
+    assert client.get(job_url).json()["status"] == "queued"
+    run_jobs()
+    job = client.get(job_url).json()
+    assert job["status"] == "done"
+    assert job["result"] == {"users": 2, "tasks": 5}
+    assert client.get(f"/companies/{test_company.id}").status_code == 404
+    assert count(User) == 0 and count(Task) == 0
+
+
+def test_delete_user_with_tasks_in_background(test_task, test_user):
+    response = client.delete(f"/users/{test_user.id}")
+    assert response.status_code == 202
+    run_jobs()
+    assert client.get(response.headers["Location"]).json()["result"] == {"users": 1, "tasks": 1}
+    assert client.get(f"/users/{test_user.id}").status_code == 404
+
+
+def test_reassign_tasks(test_task, test_user, test_company):
+    other = add_user_with_tasks(test_company.id, "other", 0)
+    response = client.post("/tasks/reassign", json={"from_user_id": test_user.id, "to_user_id": other})
+    assert response.status_code == 202
+    run_jobs()
+    assert client.get(f"/tasks/{test_task.id}").json()["user_id"] == other
+    missing = client.post("/tasks/reassign", json={"from_user_id": test_user.id, "to_user_id": 999})
+    assert missing.status_code == 400
+
+
+def test_failing_job_is_retried_then_failed(setup_database):
+    queue = JobQueue(workers=1, poll_interval=1, lease_seconds=60, max_attempts=2)
+    calls = []
+
+    @queue.handler("explode")
+    async def explode(ctx, value):
+        calls.append(value)
+        raise RuntimeError("boom")
+
+    async def enqueue():
+        async with TestingAsyncSessionLocal() as db:
+            return await queue.enqueue(db, explode, value=1)
+    job = asyncio.run(enqueue())
+    run_jobs(queue)
+    assert calls == [1, 1]
+    response = client.get(f"/jobs/{job.id}").json()
+    assert (response["status"], response["attempts"], response["error"]) == ("failed", 2, "boom")
+    assert client.get("/jobs/999").status_code == 404
+
+
+def miss_children_check(monkeypatch):
+    ''' The first AsyncSession.scalar finds no children, as if they were added right after '''
+    scalar = AsyncSession.scalar
+    calls = []
+
+    async def first_misses(self, *args, **kwargs):
+        calls.append(1)
+        return None if len(calls) == 1 else await scalar(self, *args, **kwargs)
+    monkeypatch.setattr(AsyncSession, "scalar", first_misses)
+
+
+def test_delete_user_racing_a_new_task_falls_back_to_job(test_task, test_user, monkeypatch):
+    miss_children_check(monkeypatch)
+    response = client.delete(f"/users/{test_user.id}")
+    assert response.status_code == 202
+    # the task was not detached from its user
+    assert count(Task, Task.user_id == test_user.id) == 1
+    run_jobs()
+    assert count(User) == 0 and count(Task) == 0
+
+
+def test_delete_company_racing_a_new_user_falls_back_to_job(test_user, test_company, monkeypatch):
+    miss_children_check(monkeypatch)
+    assert client.delete(f"/companies/{test_company.id}").status_code == 202
+    run_jobs()
+    assert count(User) == 0 and count(Company) == 0
+
+
+def test_reassign_tasks_to_same_user_rejected(test_task, test_user):
+    response = client.post("/tasks/reassign", json={"from_user_id": test_user.id, "to_user_id": test_user.id})
+    assert response.status_code == 400
+    # a job queued before the check existed ends at once
+    with TestingSessionLocal() as db:
+        db.add(Job(kind="reassign_tasks", payload={"from_user_id": test_user.id, "to_user_id": test_user.id},
+                   status="queued", attempts=0, created_at=0, updated_at=0))
+        db.commit()
+    run_jobs()
+    with TestingSessionLocal() as db:
+        job = db.query(Job).one()
+        assert (job.status, job.result) == ("done", {"tasks": 0})
+        assert db.get(Task, test_task.id).version == 0
+
+
+def test_stop_waits_for_running_jobs_then_hands_back_the_rest(setup_database):
+    queue = JobQueue(workers=2, poll_interval=1, lease_seconds=60, max_attempts=3)
+
+    @queue.handler("sleep")
+    async def sleep(ctx, seconds):
+        await asyncio.sleep(seconds)
+        return {"slept": seconds}
+
+    async def run():
+        async with TestingAsyncSessionLocal() as db:
+            quick = await queue.enqueue(db, sleep, seconds=0.05)
+            slow = await queue.enqueue(db, sleep, seconds=60)
+        queue.start(TestingAsyncSessionLocal)
+        await asyncio.sleep(0.02)
+        await queue.stop(timeout=0.5)
+        return quick.id, slow.id
+
+    quick, slow = asyncio.run(run())
+    with TestingSessionLocal() as db:
+        assert db.get(Job, quick).status == "done"
+        # cut short: queued again right away, without waiting for the lease or using an attempt
+        job = db.get(Job, slow)
+        assert (job.status, job.locked_until, job.attempts) == ("queued", None, 0)
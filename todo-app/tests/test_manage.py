@@ -0,0 +1,39 @@
+import pytest
+import manage
+
+
+def test_serve_runs_workers_with_server_settings(monkeypatch):
+    monkeypatch.setattr(manage.response_cache.backend, "shared", True)
+    calls = []
+    monkeypatch.setattr("uvicorn.run", lambda app, **options: calls.append((app, options)))
+    assert manage.main(["serve", "--workers", "4", "--loop", "asyncio", "--keep-alive", "75"]) == 0
+    app, options = calls[0]
+    # an import string: uvicorn can only start several workers from one
+    assert app == "main:app"
+    assert options["workers"] == 4
+    assert options["loop"] == "asyncio"
+    assert options["timeout_keep_alive"] == 75
+    assert options["backlog"] == manage.settings.SERVER_BACKLOG
+    assert options["timeout_graceful_shutdown"] == manage.settings.SERVER_GRACEFUL_SHUTDOWN_SECONDS
+
+
+def test_serve_rejects_no_workers():
+    with pytest.raises(SystemExit):
+        manage.main(["serve", "--workers", "0"])
+
+
+def test_serve_refuses_workers_with_a_per_process_cache(monkeypatch):
+    monkeypatch.setattr("uvicorn.run", lambda app, **options: pytest.fail("server started"))
+    assert not manage.response_cache.backend.shared
+    assert manage.default_workers() == 1
+    with pytest.raises(SystemExit):
+        manage.main(["serve", "--workers", "2"])
+
+
+def test_migrate_upgrades_to_head(monkeypatch):
+    command = pytest.importorskip("alembic.command")
+    calls = []
+    monkeypatch.setattr(command, "upgrade", lambda config, revision: calls.append(
+        (config.get_main_option("script_location"), revision)))
+    manage.main(["migrate"])
+    assert calls == [(str(manage.APP_DIR), "head")]
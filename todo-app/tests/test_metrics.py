@@ -0,0 +1,60 @@
+from fastapi.testclient import TestClient
+from main import app
+from utils.metrics import HTTP_DB_QUERIES, HTTP_REQUESTS, Histogram, Registry
+from utils.password import password_hasher
+from utils.rate_limit import login_rate_limiter
+
+client = TestClient(app)
+
+
+def test_metrics_per_route(test_task):
+    before = HTTP_REQUESTS.value("GET", "/tasks/{task_id}", "200")
+    queries_before = HTTP_DB_QUERIES.count("GET", "/tasks/{task_id}")
+    assert client.get(f"/tasks/{test_task.id}").status_code == 200
+    assert client.get("/tasks/999999").status_code == 404
+    assert HTTP_REQUESTS.value("GET", "/tasks/{task_id}", "200") == before + 1
+    assert HTTP_REQUESTS.value("GET", "/tasks/{task_id}", "404") >= 1
+    assert HTTP_DB_QUERIES.count("GET", "/tasks/{task_id}") == queries_before + 2
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    assert '# TYPE http_request_duration_seconds histogram' in body
+    assert 'http_requests_total{method="GET",route="/tasks/{task_id}",status="404"}' in body
+    assert 'http_requests_in_progress{method="GET"} 1' in body  # the scrape itself
+    assert "db_query_duration_seconds_count" in body
+    assert 'db_pool_checked_out{engine="test"}' in body
+
+
+def test_unknown_paths_share_one_label():
+    client.get("/no/such/path/123")
+    assert HTTP_REQUESTS.value("GET", "unmatched", "404") >= 1
+
+
+def test_password_hasher_is_exported(monkeypatch):
+    monkeypatch.setattr(password_hasher, "pending", password_hasher.workers + 2)
+    monkeypatch.setattr(password_hasher, "rejected", 7)
+    lines = client.get("/metrics").text.splitlines()
+    assert f"password_hash_running {password_hasher.workers}" in lines
+    assert "password_hash_pending 2" in lines
+    assert "password_hash_rejected_total 7" in lines
+    assert "# TYPE password_hash_completed_total counter" in lines
+
+
+def test_login_rate_limiter_is_exported(monkeypatch):
+    monkeypatch.setattr(login_rate_limiter, "rejected", 3)
+    assert "login_rate_limited_total 3" in client.get("/metrics").text.splitlines()
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    latency = registry.register(Histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1)))
+    for value in (0.05, 0.5, 5):
+        latency.observe('/a"b', value=value)
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{route="/a\\"b",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/a\\"b",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{route="/a\\"b",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{route="/a\\"b"} 3' in lines
+    assert 'latency_seconds_sum{route="/a\\"b"} 5.55' in lines
@@ -0,0 +1,59 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from passlib.hash import bcrypt
+from utils.password import PasswordHasher, build_context, pwd_context
+
+
+def test_hash_and_verify():
+    hasher = PasswordHasher(pwd_context, workers=2, max_pending=4)
+
+    async def run():
+        hashed = await hasher.hash("secret")
+        return (
+            await hasher.verify("secret", hashed),
+            await hasher.verify("wrong", hashed),
+        )
+
+    assert asyncio.run(run()) == (True, False)
+    assert hasher.stats()["completed"] == 3
+    assert hasher.stats()["in_flight"] == 0
+    hasher.shutdown()
+
+
+def test_rejects_when_queue_is_full():
+    hasher = PasswordHasher(pwd_context, workers=1, max_pending=1)
+
+    async def run():
+        first = asyncio.ensure_future(hasher.hash("one"))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as exc_info:
+            await hasher.hash("two")
+        await first
+        return exc_info.value
+
+    error = asyncio.run(run())
+    assert error.status_code == 503
+    assert error.headers["Retry-After"] == "1"
+    assert hasher.stats()["rejected"] == 1
+    hasher.shutdown()
+
+
+def test_dummy_verify_costs_a_verification():
+    hasher = PasswordHasher(pwd_context, workers=1, max_pending=4)
+
+    async def run():
+        return await hasher.dummy_verify("anything"), await hasher.dummy_verify("again")
+
+    assert asyncio.run(run()) == (False, False)
+    # the throwaway hash is made once, then each call is one verification
+    assert hasher.stats()["completed"] == 3
+    hasher.shutdown()
+
+
+def test_context_flags_other_costs_for_update():
+    context = build_context("bcrypt")
+    assert not context.needs_update(context.hash("secret"))
+    assert context.needs_update(bcrypt.using(rounds=4).hash("secret"))
+    with pytest.raises(ValueError):
+        build_context("md5")
@@ -0,0 +1,40 @@
+import logging
+from fastapi.testclient import TestClient
+from main import app
+
+client = TestClient(app)
+
+
+def timings(response) -> dict:
+    entries = [entry.strip().split(";") for entry in response.headers["Server-Timing"].split(",")]
+    return {parts[0]: float(parts[1].removeprefix("dur=")) for parts in entries}
+
+
+def test_server_timing_only_when_profiling(test_task):
+    assert "Server-Timing" not in client.get(f"/tasks/{test_task.id}").headers
+    response = client.get(f"/tasks/{test_task.id}", headers={"X-Profile": "1"})
+    assert response.status_code == 200
+    breakdown = timings(response)
+    assert {"db", "serialize", "total"} <= breakdown.keys()
+    assert breakdown["db"] <= breakdown["total"]
+    assert 'desc="1 queries"' in response.headers["Server-Timing"]
+
+
+def test_server_timing_auth_phase(test_user, monkeypatch):
+    monkeypatch.setattr("config.settings.PROFILE_REQUESTS", True)
+    response = client.post("/login/", data={"username": "testuser", "password": "testpass"})
+    assert "auth" in timings(response)
+    token = response.json()["access_token"]
+    response = client.get("/users/me", headers={"Authorization": f"Bearer {token}"})
+    assert "auth" in timings(response)
+
+
+def test_slow_query_logged_with_plan(test_task, monkeypatch, caplog):
+    monkeypatch.setattr("config.settings.SLOW_QUERY_MS", 1e-6)
+    with caplog.at_level(logging.WARNING, logger="utils.profiling"):
+        client.get(f"/tasks/{test_task.id}")
+    slow = [r.getMessage() for r in caplog.records if r.getMessage().startswith("Slow query")]
+    assert slow
+    assert "FROM tasks" in slow[0]
+    assert f"parameters: ({test_task.id}," in slow[0]
+    assert "USING INTEGER PRIMARY KEY" in slow[0]
@@ -0,0 +1,62 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from main import app
+from utils.rate_limit import InMemoryBackend, LoginRateLimiter, RedisBackend
+
+client = TestClient(app)
+
+
+def exercise(backend):
+    limiter = LoginRateLimiter(backend, per_username=2, per_ip=3, window=60)
+
+    async def attempt(username, ip="10.0.0.1"):
+        try:
+            await limiter.check(username, ip)
+            return None
+        except HTTPException as e:
+            return e
+
+    async def run():
+        return [await attempt("alice"), await attempt("Alice"), await attempt("alice"),
+                await attempt("bob"), await attempt("carol"), await attempt("carol", "10.0.0.2")]
+
+    ok1, ok2, user_limited, ok3, ip_limited, other_ip = asyncio.run(run())
+    assert ok1 is None and ok2 is None and ok3 is None and other_ip is None
+    assert user_limited.status_code == 429
+    assert int(user_limited.headers["Retry-After"]) > 0
+    # alice's rejected attempt did not count, so the IP had three: alice twice and bob
+    assert ip_limited.status_code == 429
+
+
+def test_in_memory_backend():
+    exercise(InMemoryBackend(max_keys=100))
+
+
+def test_redis_backend():
+    fakeredis = pytest.importorskip("fakeredis")
+    exercise(RedisBackend(fakeredis.FakeAsyncRedis()))
+
+
+def test_in_memory_backend_is_bounded():
+    backend = InMemoryBackend(max_keys=2)
+    for name in ("a", "b", "c"):
+        asyncio.run(backend.hit(name, 1, 60))
+    assert list(backend._attempts) == ["b", "c"]
+
+
+def test_login_throttled_before_password_check(test_user, monkeypatch):
+    verified = []
+
+    async def verify_password(plain, hashed):
+        verified.append(plain)
+        return False
+    monkeypatch.setattr("utils.auth_user.verify_password", verify_password)
+    monkeypatch.setattr("utils.rate_limit.login_rate_limiter.per_username", 2)
+    for _ in range(2):
+        client.post("/login/", data={"username": "testuser", "password": "wrong"})
+    response = client.post("/login/", data={"username": "testuser", "password": "testpass"})
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+    assert len(verified) == 2
@@ -0,0 +1,99 @@
+import asyncio
+import pytest
+from starlette.requests import Request
+from utils.response_cache import InMemoryBackend, RedisBackend, ResponseCache
+
+
+def make_request(path, headers=None):
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "query_string": b"",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+    })
+
+
+def exercise(backend):
+    cache = ResponseCache(backend, ttl=60)
+    calls = []
+
+    async def produce():
+        calls.append(1)
+        return [1, 2, 3]
+
+    async def run():
+        first = await cache.respond(make_request("/items"), ["items"], list[int], produce)
+        again = await cache.respond(make_request("/items"), ["items"], list[int], produce)
+        etag = first.headers["etag"]
+        not_modified = await cache.respond(
+            make_request("/items", {"If-None-Match": etag}), ["items"], list[int], produce
+        )
+        await cache.invalidate("items")
+        changed = await cache.respond(
+            make_request("/items", {"If-None-Match": etag}), ["items"], list[int], produce
+        )
+        return first, again, not_modified, changed
+
+    first, again, not_modified, changed = asyncio.run(run())
+    assert first.body == b"[1,2,3]"
+    assert again.body == first.body
+    assert not_modified.status_code == 304
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != first.headers["etag"]
+    # produced once before and once after the invalidation
+    assert len(calls) == 2
+
+
+def test_in_memory_backend():
+    exercise(InMemoryBackend(max_entries=10))
+
+
+def test_redis_backend():
+    fakeredis = pytest.importorskip("fakeredis")
+    exercise(RedisBackend(fakeredis.FakeAsyncRedis()))
+
+
+def test_in_memory_backend_expires_what_other_workers_invalidate(monkeypatch):
+    # another worker handled the write: nothing here is bumped, only time passes
+    now = [1000.0]
+    monkeypatch.setattr("utils.response_cache.time.monotonic", lambda: now[0])
+    cache = ResponseCache(InMemoryBackend(max_entries=10, ttl=60), ttl=60)
+
+    async def produce():
+        return [1]
+
+    async def run():
+        first = await cache.respond(make_request("/items"), ["items"], list[int], produce)
+        etag = first.headers["etag"]
+        now[0] += 30
+        cached = await cache.respond(make_request("/items", {"If-None-Match": etag}), ["items"], list[int], produce)
+        now[0] += 31
+        expired = await cache.respond(make_request("/items", {"If-None-Match": etag}), ["items"], list[int], produce)
+        return cached, expired
+
+    cached, expired = asyncio.run(run())
+    assert cached.status_code == 304
+    assert expired.status_code == 200
+
+
+def test_bodies_read_from_a_replica_are_not_cached():
+    cache = ResponseCache(InMemoryBackend(max_entries=10), ttl=60)
+    rows = [[1]]
+
+    async def produce():
+        return rows[-1]
+
+    async def run():
+        # the replica has not caught up with a write the version counter already knows about
+        await cache.invalidate("items")
+        lagging = await cache.respond(make_request("/items"), ["items"], list[int], produce, store=False)
+        rows.append([1, 2])
+        fresh = await cache.respond(make_request("/items"), ["items"], list[int], produce)
+        return lagging, fresh
+
+    lagging, fresh = asyncio.run(run())
+    assert lagging.body == b"[1]"
+    assert "etag" not in lagging.headers
+    assert fresh.body == b"[1,2]"
+    assert "etag" in fresh.headers
@@ -0,0 +1,77 @@
+import asyncio
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from main import app
+from manage import rebuild_stats
+from tests.conftest import TestingSessionLocal, async_engine
+from tests.test_jobs import add_user_with_tasks, run_jobs
+
+client = TestClient(app)
+
+
+def create_task(user_id, priority, completed=False):
+    response = client.post("/tasks/", json={
+        "summary": "Task", "status": completed, "priority": priority, "user_id": user_id,
+    })
+    assert response.status_code == 200
+    return response.json()
+
+
+def by_priority(stats):
+    return {p["priority"]: (p["total"], p["completed"]) for p in stats["by_priority"]}
+
+
+def test_user_stats_follow_task_writes(test_user):
+    first = create_task(test_user.id, 1)
+    create_task(test_user.id, 1, completed=True)
+    third = create_task(test_user.id, 3)
+
+    stats = client.get(f"/users/{test_user.id}/stats").json()
+    assert stats["total"] == 3 and stats["completed"] == 1 and stats["open"] == 2
+    assert by_priority(stats) == {1: (2, 1), 3: (1, 0)}
+
+    client.patch(f"/tasks/{first['id']}", json={"status": True})
+    client.put(f"/tasks/{third['id']}", json={
+        "summary": "Task", "status": False, "priority": None, "user_id": test_user.id,
+    })
+    stats = client.get(f"/users/{test_user.id}/stats").json()
+    assert stats["completed"] == 2
+    assert by_priority(stats) == {1: (2, 2), None: (1, 0)}
+
+    client.delete(f"/tasks/{first['id']}")
+    client.request("DELETE", "/tasks/bulk", json={"ids": [third["id"]]})
+    stats = client.get(f"/users/{test_user.id}/stats").json()
+    assert stats == {"total": 1, "completed": 1, "open": 0, "by_priority": [
+        {"priority": 1, "total": 1, "completed": 1}]}
+
+
+def test_company_stats_sum_users_and_follow_reassignment(test_user, test_company):
+    other = add_user_with_tasks(test_company.id, "other", 2)
+    create_task(test_user.id, 1, completed=True)
+
+    stats = client.get(f"/companies/{test_company.id}/stats").json()
+    assert stats["total"] == 3 and stats["completed"] == 1
+    assert by_priority(stats) == {1: (3, 1)}
+
+    assert client.post("/tasks/reassign", json={"from_user_id": other, "to_user_id": test_user.id}).status_code == 202
+    run_jobs()
+    assert client.get(f"/users/{other}/stats").json()["total"] == 0
+    assert client.get(f"/users/{test_user.id}/stats").json()["total"] == 3
+
+
+def test_stats_of_missing_entities():
+    assert client.get("/users/999/stats").status_code == 404
+    assert client.get("/companies/999/stats").status_code == 404
+
+
+def test_rebuild_fixes_drift(test_user):
+    create_task(test_user.id, 2)
+    create_task(test_user.id, 2, completed=True)
+    with TestingSessionLocal() as db:
+        db.execute(text("UPDATE task_stats SET task_count = 42"))
+        db.commit()
+    assert client.get(f"/users/{test_user.id}/stats").json()["total"] == 84
+
+    assert asyncio.run(rebuild_stats(async_engine)) == 2
+    stats = client.get(f"/users/{test_user.id}/stats").json()
+    assert stats["total"] == 2 and by_priority(stats) == {2: (2, 1)}
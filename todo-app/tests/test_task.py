@@ -1,5 +1,10 @@
+import json
+import pytest
+from sqlalchemy import event
 from fastapi.testclient import TestClient
 from main import app
+from tests.conftest import async_engine
+from utils.pagination import encode_cursor
 
 client = TestClient(app)
 
@@ -33,13 +38,14 @@ def test_create_task_user_not_exist(setup_database):
 def test_list_tasks_empty(setup_database):
     response = client.get("/tasks/")
     assert response.status_code == 200
-    assert response.json() == []
+    assert response.json()["items"] == []
 
 
 def test_list_tasks(test_task):
     response = client.get("/tasks/")
     assert response.status_code == 200
-    assert len(response.json()) == 1
+    assert len(response.json()["items"]) == 1
+    assert response.json()["next_cursor"] is None
 
 
 def test_get_task(test_task):
@@ -77,3 +83,227 @@ def test_update_task_not_found():
     response = client.put("/tasks/999", json=update_data)
     assert response.status_code == 400
     assert response.json()["detail"] == "task not exists"
+
+
+def test_export_tasks(test_task):
+    response = client.get("/tasks/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = response.text.splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])["id"] == test_task.id
+
+
+def test_create_tasks_bulk(test_user):
+    tasks = [
+        {"summary": "Bulk 1", "priority": 1, "user_id": test_user.id},
+        {"summary": "Bulk 2", "priority": 2, "user_id": 999},
+        {"summary": "Bulk 3", "priority": 3, "user_id": test_user.id},
+    ]
+    response = client.post("/tasks/bulk", json=tasks)
+    assert response.status_code == 200
+    results = response.json()
+    assert [r["ok"] for r in results] == [True, False, True]
+    assert results[1]["detail"] == "User does not exist"
+    assert client.get(f"/tasks/{results[2]['id']}").json()["summary"] == "Bulk 3"
+
+
+def test_update_tasks_bulk(test_task):
+    updates = [
+        {"id": test_task.id, "summary": "Bulk updated"},
+        {"id": 999, "summary": "Missing"},
+    ]
+    response = client.patch("/tasks/bulk", json=updates)
+    assert response.status_code == 200
+    assert [r["ok"] for r in response.json()] == [True, False]
+    task = client.get(f"/tasks/{test_task.id}").json()
+    assert task["summary"] == "Bulk updated"
+    assert task["priority"] == test_task.priority
+
+
+def test_delete_tasks_bulk(test_task):
+    response = client.request(
+        "DELETE", "/tasks/bulk", json={"ids": [test_task.id, 999]}
+        )
+    assert response.status_code == 200
+    assert [r["ok"] for r in response.json()] == [True, False]
+    assert client.get(f"/tasks/{test_task.id}").status_code == 404
+
+
+def create_tasks(user_id, priorities, status=False):
+    tasks = [
+        {"summary": f"Task {p}", "priority": p, "status": status, "user_id": user_id}
+        for p in priorities
+    ]
+    return client.post("/tasks/bulk", json=tasks).json()
+
+
+def test_list_tasks_filters(test_user):
+    create_tasks(test_user.id, [1, 2, 3])
+    create_tasks(test_user.id, [4, 5], status=True)
+    response = client.get("/tasks/", params={"status": True})
+    assert [t["priority"] for t in response.json()["items"]] == [4, 5]
+    response = client.get("/tasks/", params={"priority_min": 2, "priority_max": 4})
+    assert [t["priority"] for t in response.json()["items"]] == [2, 3, 4]
+    response = client.get(
+        "/tasks/",
+        params={"company_id": test_user.company_id, "status": False}
+        )
+    assert len(response.json()["items"]) == 3
+    response = client.get("/tasks/", params={"user_id": 999})
+    assert response.json()["items"] == []
+
+
+def list_all_pages(params):
+    seen, cursor = [], None
+    while True:
+        page_params = dict(params, limit=2)
+        if cursor:
+            page_params["after"] = cursor
+        body = client.get("/tasks/", params=page_params).json()
+        seen += [(t["priority"], t["id"]) for t in body["items"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return seen
+
+
+def test_list_tasks_sorted_by_priority_pages(test_user):
+    results = create_tasks(test_user.id, [3, 1, 2, 3, 1, 2])
+    # tasks without a priority sort first ascending and last descending
+    client.patch("/tasks/bulk", json=[
+        {"id": results[2]["id"], "priority": None},
+        {"id": results[5]["id"], "priority": None},
+    ])
+    descending = list_all_pages({"sort": "-priority"})
+    assert [p for p, _ in descending] == [3, 3, 1, 1, None, None]
+    ascending = list_all_pages({"sort": "priority"})
+    assert [p for p, _ in ascending] == [None, None, 1, 1, 3, 3]
+    assert len(set(ascending)) == 6
+
+
+@pytest.mark.parametrize("value", [{"a": 1}, [1, 2], "high", 1.5])
+def test_list_tasks_sorted_rejects_tampered_cursor(value):
+    response = client.get("/tasks/", params={"sort": "-priority", "after": encode_cursor([value, 5])})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+    assert client.get("/tasks/", params={"sort": "name"}).status_code == 422
+
+
+def test_search_tasks(test_user):
+    client.post("/tasks/bulk", json=[
+        {"summary": "Write report", "description": "quarterly numbers", "priority": 1, "user_id": test_user.id},
+        {"summary": "Review report", "description": "report for the board", "priority": 2, "user_id": test_user.id},
+        {"summary": "Buy milk", "description": None, "priority": 3, "user_id": test_user.id},
+    ])
+    response = client.get("/tasks/search", params={"q": "report"})
+    assert response.status_code == 200
+    # more occurrences rank first
+    assert [t["summary"] for t in response.json()["items"]] == ["Review report", "Write report"]
+    response = client.get("/tasks/search", params={"q": "quart"})
+    assert [t["summary"] for t in response.json()["items"]] == ["Write report"]
+    response = client.get("/tasks/search", params={"q": 'milk" OR *'})
+    assert response.json()["items"] == []
+
+
+def test_search_tasks_pages_and_follows_writes(test_user):
+    results = create_tasks(test_user.id, [1, 2, 3])
+    first = client.get("/tasks/search", params={"q": "task", "limit": 2}).json()
+    assert len(first["items"]) == 2
+    second = client.get(
+        "/tasks/search",
+        params={"q": "task", "limit": 2, "after": first["next_cursor"]}
+        ).json()
+    assert len(second["items"]) == 1
+    assert second["next_cursor"] is None
+    # the index follows updates and deletes
+    client.patch("/tasks/bulk", json=[{"id": results[0]["id"], "summary": "Renamed"}])
+    client.request("DELETE", "/tasks/bulk", json={"ids": [results[1]["id"]]})
+    response = client.get("/tasks/search", params={"q": "task"})
+    assert [t["id"] for t in response.json()["items"]] == [results[2]["id"]]
+
+
+def test_get_tasks_by_user_id_etag(test_task, test_user):
+    first = client.get(f"/tasks/user/{test_user.id}")
+    assert first.status_code == 200
+    assert [t["id"] for t in first.json()] == [test_task.id]
+    etag = first.headers["etag"]
+    assert client.get(
+        f"/tasks/user/{test_user.id}",
+        headers={"If-None-Match": etag}
+        ).status_code == 304
+    client.delete(f"/tasks/{test_task.id}")
+    fresh = client.get(f"/tasks/user/{test_user.id}", headers={"If-None-Match": etag})
+    assert fresh.status_code == 200
+    assert fresh.json() == []
+
+
+def test_get_task_expand_user(test_task):
+    response = client.get(f"/tasks/{test_task.id}", params={"expand": "user"})
+    assert response.json()["user"]["username"] == "testuser"
+    assert "password" not in response.json()["user"]
+    listed = client.get("/tasks/", params={"expand": "user"}).json()["items"]
+    assert listed[0]["user"]["id"] == test_task.user_id
+
+
+def test_fast_list_responses_match(test_user, monkeypatch):
+    results = create_tasks(test_user.id, [2, 1, 3], status=True)
+    client.patch("/tasks/bulk", json=[{"id": results[1]["id"], "priority": None}])
+    # stored as the text '0', which must not come out truthy
+    create_tasks(test_user.id, [4], status=False)
+    params = {"sort": "-priority", "limit": 2}
+    slow_page = client.get("/tasks/", params=params).json()
+    slow_export = client.get("/tasks/export").text
+    slow_users = client.get("/users/export").text
+    monkeypatch.setattr("config.settings.FAST_LIST_RESPONSES", True)
+    fast_page = client.get("/tasks/", params=params).json()
+    assert fast_page == slow_page
+    assert [t["status"] for t in fast_page["items"]] == [False, True]
+    next_page = client.get("/tasks/", params=dict(params, after=fast_page["next_cursor"])).json()
+    assert [t["priority"] for t in next_page["items"]] == [2, None]
+    assert [json.loads(line) for line in client.get("/tasks/export").text.splitlines()] == \
+        [json.loads(line) for line in slow_export.splitlines()]
+    assert json.loads(client.get("/users/export").text) == json.loads(slow_users)
+
+
+def test_update_task_user_not_exist(test_task):
+    response = client.put(f"/tasks/{test_task.id}", json={"summary": "Moved", "priority": 1, "user_id": 999})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "User does not exist"
+
+
+def test_patch_task_writes_only_sent_fields(test_task):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        response = client.patch(f"/tasks/{test_task.id}", json={"status": False})
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", capture)
+    assert response.status_code == 200
+    assert response.json()["summary"] == "Test Task"
+    assert response.json()["status"] is False
+    assert response.json()["version"] == 1
+    assert len(statements) == 1
+    assert statements[0].startswith("UPDATE tasks SET status=?, version=(tasks.version + ?) WHERE")
+
+
+def test_patch_task_version_conflict(test_task):
+    assert client.patch(f"/tasks/{test_task.id}", json={"priority": 1, "version": 0}).status_code == 200
+    # a second writer that also read version 0 must not overwrite the first
+    response = client.patch(f"/tasks/{test_task.id}", json={"priority": 5, "version": 0})
+    assert response.status_code == 409
+    assert client.get(f"/tasks/{test_task.id}").json()["priority"] == 1
+    assert client.patch("/tasks/999", json={"priority": 5, "version": 0}).status_code == 404
+
+
+@pytest.mark.parametrize("field", ["summary", "status", "user_id"])
+def test_patch_task_rejects_null_for_required_fields(test_task, field):
+    assert client.patch(f"/tasks/{test_task.id}", json={field: None}).status_code == 422
+    response = client.get(f"/tasks/{test_task.id}")
+    assert response.status_code == 200
+    assert response.json()["version"] == 0
+    # optional columns can still be cleared
+    assert client.patch(f"/tasks/{test_task.id}", json={"priority": None}).json()["priority"] is None
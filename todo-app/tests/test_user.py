@@ -1,5 +1,11 @@
 from fastapi.testclient import TestClient
+from sqlalchemy import event
 from main import app
+from models.base import User
+from tests.conftest import TestingSessionLocal, async_engine
+from passlib.hash import bcrypt
+from utils.password import pwd_context
+from utils.revocation import revocation_list
 
 client = TestClient(app)
 
@@ -65,14 +71,14 @@ def test_create_user_duplicate_email(test_user, test_company):
 def test_list_users_empty():
     response = client.get("/users/")
     assert response.status_code == 200
-    assert response.json() == []
+    assert response.json()["items"] == []
 
 
 def test_list_users_with_data(test_user):
     response = client.get("/users/")
     assert response.status_code == 200
-    assert len(response.json()) == 1
-    assert response.json()[0]["username"] == "testuser"
+    assert len(response.json()["items"]) == 1
+    assert response.json()["items"][0]["username"] == "testuser"
 
 
 def test_get_user_success(test_user):
@@ -118,3 +124,189 @@ def test_delete_user_not_found():
     response = client.delete("/users/999")
     assert response.status_code == 404
     assert response.json()["detail"] == "User not found"
+
+
+def test_export_users(test_user):
+    response = client.get("/users/export")
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    assert len(lines) == 1
+    assert '"username":"testuser"' in lines[0]
+    assert "password" not in lines[0]
+
+
+def test_update_user_password_is_hashed(test_user):
+    response = client.put(f"/users/{test_user.id}", json={"password": "newpass"})
+    assert response.status_code == 200
+    login = client.post(
+        "/login/",
+        data={"username": "testuser", "password": "newpass"}
+        )
+    assert login.status_code == 200
+    assert "access_token" in login.json()
+
+
+def login_headers(username="testuser", password="testpass"):
+    response = client.post(
+        "/login/",
+        data={"username": username, "password": password}
+        )
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def test_get_me(test_user):
+    response = client.get("/users/me", headers=login_headers())
+    assert response.status_code == 200
+    assert response.json()["username"] == "testuser"
+    assert "password" not in response.json()
+
+
+def test_get_me_sees_updates_and_deletes(test_user):
+    headers = login_headers()
+    assert client.get("/users/me", headers=headers).json()["first_name"] == "Test"
+    client.put(f"/users/{test_user.id}", json={"first_name": "Changed"})
+    assert client.get("/users/me", headers=headers).json()["first_name"] == "Changed"
+    client.delete(f"/users/{test_user.id}")
+    assert client.get("/users/me", headers=headers).status_code == 401
+
+
+def test_list_users_expand_without_n_plus_one(test_user, test_company):
+    for i in range(3):
+        client.post("/users/", json={
+            "username": f"user{i}",
+            "email": f"user{i}@example.com",
+            "password": "password123",
+            "first_name": "User",
+            "last_name": str(i),
+            "company_id": test_company.id
+        })
+    client.post("/tasks/", json={"summary": "Mine", "priority": 1, "user_id": test_user.id})
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count)
+    try:
+        response = client.get("/users/", params={"expand": "company,tasks"})
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", count)
+    assert response.status_code == 200
+    users = response.json()["items"]
+    assert len(users) == 4
+    assert all(u["company"]["name"] == "Test Company" for u in users)
+    assert [t["summary"] for t in users[0]["tasks"]] == ["Mine"]
+    # users joined with their company, plus one query for all the tasks
+    assert len(statements) == 2
+
+
+def test_get_user_expand(test_user):
+    plain = client.get(f"/users/{test_user.id}").json()
+    assert "company" not in plain and "tasks" not in plain
+    response = client.get(f"/users/{test_user.id}", params={"expand": "company"})
+    assert response.json()["company"]["id"] == test_user.company_id
+    assert "tasks" not in response.json()
+    response = client.get(f"/users/{test_user.id}", params={"expand": "password"})
+    assert response.status_code == 400
+
+
+def test_token_version_bumped_when_claims_change(test_user):
+    def token_version():
+        with TestingSessionLocal() as db:
+            return db.get(User, test_user.id).token_version
+    client.put(f"/users/{test_user.id}", json={"first_name": "Changed"})
+    assert token_version() == 0
+    client.put(f"/users/{test_user.id}", json={"is_admin": True})
+    assert token_version() == 1
+
+
+def test_refresh_token_issues_new_tokens(test_user):
+    tokens = client.post("/login/", data={"username": "testuser", "password": "testpass"}).json()
+    response = client.post("/login/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    assert client.get("/users/me", headers=headers).json()["username"] == "testuser"
+    # refresh tokens are single use and never accepted as access tokens
+    assert client.post("/login/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+    headers = {"Authorization": f"Bearer {tokens['refresh_token']}"}
+    assert client.get("/users/me", headers=headers).status_code == 401
+
+
+def test_refresh_token_replay_rejected_by_other_workers(test_user):
+    tokens = client.post("/login/", data={"username": "testuser", "password": "testpass"}).json()
+    assert client.post("/login/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 200
+    # a worker that has not synced the revocation yet still finds it in the table
+    revocation_list.clear()
+    assert client.post("/login/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+
+def test_logout_revokes_tokens(test_user):
+    tokens = client.post("/login/", data={"username": "testuser", "password": "testpass"}).json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    response = client.post("/login/logout", headers=headers, json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    assert client.get("/users/me", headers=headers).status_code == 401
+    assert client.post("/login/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+
+def test_stateless_logout_does_not_load_the_user(test_user, monkeypatch):
+    monkeypatch.setattr("config.settings.JWT_STATELESS", True)
+    headers = login_headers()
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        assert client.post("/login/logout", headers=headers).status_code == 200
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", capture)
+    # only the token version is read, then the revocation is written
+    assert not any("users.email" in statement for statement in statements)
+    assert any("users.token_version" in statement for statement in statements)
+
+
+def test_login_upgrades_outdated_password_hash(test_user):
+    with TestingSessionLocal() as db:
+        db.get(User, test_user.id).password = bcrypt.using(rounds=4).hash("testpass")
+        db.commit()
+    response = client.post("/login/", data={"username": "testuser", "password": "testpass"})
+    assert response.status_code == 200
+    with TestingSessionLocal() as db:
+        upgraded = db.get(User, test_user.id).password
+    assert pwd_context.identify(upgraded) == "bcrypt"
+    assert not pwd_context.needs_update(upgraded)
+    assert pwd_context.verify("testpass", upgraded)
+
+
+def test_writes_are_one_statement(test_company):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count)
+    try:
+        response = client.post("/users/", json={
+            "username": "single", "email": "single@example.com", "password": "password123",
+            "first_name": "One", "last_name": "Statement", "company_id": test_company.id
+        })
+        user_id = response.json()["id"]
+        client.put(f"/users/{user_id}", json={"first_name": "Changed"})
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", count)
+    assert response.status_code == 200
+    # no duplicate checks before the INSERT and no SELECT after either write
+    assert [s.split()[0] for s in statements] == ["INSERT", "UPDATE"]
+    assert client.get(f"/users/{user_id}").json()["first_name"] == "Changed"
+
+
+def test_update_user_duplicate_email(test_user, test_company):
+    client.post("/users/", json={
+        "username": "other", "email": "other@example.com", "password": "password123",
+        "first_name": "Other", "last_name": "User", "company_id": test_company.id
+    })
+    response = client.put(f"/users/{test_user.id}", json={"email": "other@example.com"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Email already registered"
@@ -0,0 +1,29 @@
+from unittest.mock import patch
+from utils.user_cache import TTLCache
+
+
+def test_entries_expire_after_ttl():
+    cache = TTLCache(maxsize=10, ttl=30)
+    with patch("utils.user_cache.time.monotonic", return_value=100.0):
+        cache.set("alice", "principal")
+        assert cache.get("alice") == "principal"
+    with patch("utils.user_cache.time.monotonic", return_value=131.0):
+        assert cache.get("alice") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=30)
+    cache.set("alice", 1)
+    cache.set("bob", 2)
+    cache.get("alice")
+    cache.set("carol", 3)
+    assert cache.get("bob") is None
+    assert cache.get("alice") == 1
+    assert cache.get("carol") == 3
+
+
+def test_disabled_cache_stores_nothing():
+    cache = TTLCache(maxsize=10, ttl=0)
+    cache.set("alice", 1)
+    assert cache.get("alice") is None
@@ -1,70 +1,166 @@
 from fastapi import Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from models.base import User
 from schemas import auth as schemas_auth, user as schemas_user
-from passlib.context import CryptContext
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+from config import settings
 from database import get_db
+from utils.jwt_keys import key_set
+from utils.password import password_hasher
+from utils.profiling import timed_phase
+from utils.revocation import revocation_list
+from utils.user_cache import token_versions, user_cache
 from jose import JWTError, jwt
 import logging
 from fastapi.security import OAuth2PasswordBearer
 
-SECRET_KEY = "super-secret-key"
-ALGORITHM = "HS256"
-
 logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login/")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def verify_password(plain, hashed):
-    return pwd_context.verify(plain, hashed)
+async def verify_password(plain, hashed):
+    return await password_hasher.verify(plain, hashed)
 
 # get user from db
-def get_user(user: schemas_user.User, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.username == user.username).first()
+async def get_user(user: schemas_user.User, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(User).where(User.username == user.username))
+    db_user = result.scalars().first()
     if db_user:
         return db_user
     else:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
 
 # authenticate user
-def authenticate_user(db: Session, user_name: str, password: str):
-    user = db.query(User).filter(User.username == user_name).first()
-    if not user or not verify_password(password, user.password):
+@timed_phase("auth")
+async def authenticate_user(db: AsyncSession, user_name: str, password: str):
+    result = await db.execute(select(User).where(User.username == user_name))
+    user = result.scalars().first()
+    if not user:
+        return await password_hasher.dummy_verify(password)
+    if not await verify_password(password, user.password):
         return False
+    if password_hasher.needs_update(user.password):
+        # the plain password is only at hand now: upgrade the stored hash to the current parameters
+        user.password = await password_hasher.hash(password)
+        await db.commit()
     return user
 
+# claims of a user carried by access tokens; changing one bumps User.token_version
+CLAIM_FIELDS = ("username", "company_id", "is_admin")
+
+
+def principal_claims(user) -> dict:
+    ''' Claims that let a token stand in for `user` without a database lookup '''
+    return {
+        "sub": user.username,
+        "uid": user.id,
+        "cid": user.company_id,
+        "adm": bool(user.is_admin),
+        "ver": user.token_version or 0,
+    }
+
 # create access token
-def create_access_token(data: dict, expires_delta: timedelta | None = None):
+def create_access_token(data: dict, expires_delta: timedelta | None = None, token_type: str = "access"):
     to_encode = data.copy()
-    expire = datetime.now() + (expires_delta or timedelta(minutes=15))
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+    now = datetime.now(timezone.utc)
+    to_encode.update({
+        "iat": now,
+        "exp": now + (expires_delta or timedelta(minutes=15)),
+        "typ": token_type,
+        "jti": uuid4().hex,  # lets this one token be revoked
+    })
+    return key_set.encode(to_encode)
+
+# create refresh token
+def create_refresh_token(user) -> str:
+    ''' Long-lived token only accepted by /login/refresh, to get new access tokens without the password '''
+    return create_access_token(
+        data={"sub": user.username, "uid": user.id},
+        expires_delta=timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+        token_type="refresh",
+    )
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=401,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def decode_token(token: str, token_type: str = "access") -> dict:
+    ''' Verified claims of a token of `token_type`, 401 if it is invalid,
+    revoked or has no subject '''
     try:
-        logger.info(f"Received token: {token[:20]}...")
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = str(payload.get("sub"))
-        logger.info(f"Decoded username: {username}")
-        if username is None:
-            raise credentials_exception
-        token_data = schemas_auth.TokenData(username=username)
+        payload = key_set.decode(token)
     except JWTError as e:
-        logger.error(f"JWT Error: {e}")
-        raise credentials_exception
-    # user = get_user(username, db=db)
-    user = db.query(User).filter(User.username == token_data.username).first()
-    logger.info(f"Found user: {user.username if user else 'None'}")
+        logger.error("JWT Error: %s", e)
+        raise credentials_exception()
+    if payload.get("sub") is None:
+        raise credentials_exception()
+    # tokens issued before typ existed are all access tokens
+    if payload.get("typ", "access") != token_type:
+        raise credentials_exception()
+    if revocation_list.is_revoked(payload.get("jti")):
+        raise credentials_exception()
+    return payload
+
+async def load_user(db: AsyncSession, username: str) -> schemas_user.User:
+    ''' User for a token subject, from the cache or the database '''
+    # served from the cache on hot paths, see utils/user_cache.py
+    cached = user_cache.get(username)
+    if cached is not None:
+        return cached
+    result = await db.execute(select(User).where(User.username == username))
+    user = result.scalars().first()
     if user is None:
-        raise credentials_exception
-    return user
\ No newline at end of file
+        logger.debug("No user for token subject %s", username)
+        raise credentials_exception()
+    current_user = schemas_user.User.model_validate(user, from_attributes=True)
+    user_cache.set(username, current_user)
+    return current_user
+
+@timed_phase("auth")
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    payload = decode_token(token)
+    token_data = schemas_auth.TokenData(username=str(payload["sub"]))
+    return await load_user(db, token_data.username)
+
+async def current_token_version(db: AsyncSession, user_id: int) -> int | None:
+    ''' Token version of a user, None if the user no longer exists '''
+    version = token_versions.get(user_id)
+    if version is None:
+        version = await db.scalar(select(User.token_version).where(User.id == user_id))
+        if version is not None:
+            token_versions.set(user_id, version)
+    return version
+
+def access_token_claims(token: str = Depends(oauth2_scheme)) -> dict:
+    ''' Verified claims of the bearer access token, decoded once per request '''
+    return decode_token(token)
+
+@timed_phase("auth")
+async def get_current_principal(payload: dict = Depends(access_token_claims), db: AsyncSession = Depends(get_db)):
+    ''' Who is calling, for routes that authorize but do not need the user's row;
+    those that do (e.g. /users/me) use `get_current_user`.
+
+    With JWT_STATELESS the principal is built from the token's claims, the
+    database is only asked for the user's token version (cached) and for the
+    user itself when the token's version is stale.
+    '''
+    if settings.JWT_STATELESS and "uid" in payload and "ver" in payload:
+        version = await current_token_version(db, payload["uid"])
+        if version is None:
+            raise credentials_exception()
+        if version == payload["ver"]:
+            return schemas_auth.Principal(
+                id=payload["uid"],
+                username=payload["sub"],
+                company_id=payload["cid"],
+                is_admin=payload["adm"],
+                token_version=payload["ver"],
+            )
+    user = await load_user(db, str(payload["sub"]))
+    return schemas_auth.Principal.model_validate(user, from_attributes=True)
@@ -0,0 +1,86 @@
+''' Background jobs deleting or moving many rows, a chunk per transaction so locks
+stay brief and the API keeps writing meanwhile. Each one is safe to run again. '''
+from sqlalchemy import delete, select, update
+from config import settings
+from models.base import Company, Task, User
+from utils.jobs import JobContext, job_queue
+from utils.response_cache import response_cache
+from utils.user_cache import invalidate_user
+
+
+async def delete_tasks_of(ctx: JobContext, user_ids: list[int], counts: dict):
+    ''' Delete the tasks of `user_ids`, a chunk at a time '''
+    while True:
+        chunk = select(Task.id).where(Task.user_id.in_(user_ids)).limit(settings.JOB_CHUNK_SIZE)
+        result = await ctx.db.execute(
+            delete(Task).where(Task.id.in_(chunk)).execution_options(synchronize_session=False)
+        )
+        if not result.rowcount:
+            return
+        counts["tasks"] += result.rowcount
+        await ctx.progress(**counts)
+        await response_cache.invalidate("tasks")
+
+
+async def delete_users(ctx: JobContext, user_ids: list[int], counts: dict):
+    ''' Delete users whose tasks are gone, and forget their cached principals '''
+    usernames = await ctx.db.scalars(
+        delete(User).where(User.id.in_(user_ids)).returning(User.username)
+        .execution_options(synchronize_session=False)
+    )
+    usernames = usernames.all()
+    counts["users"] += len(usernames)
+    await ctx.progress(**counts)
+    invalidate_user(*usernames)
+    for user_id in user_ids:
+        invalidate_user(user_id=user_id)
+    await response_cache.invalidate("users")
+
+
+@job_queue.handler("delete_company")
+async def delete_company(ctx: JobContext, company_id: int) -> dict:
+    ''' Delete a company with its users and their tasks '''
+    counts = {"users": 0, "tasks": 0}
+    while True:
+        user_ids = await ctx.db.scalars(
+            select(User.id).where(User.company_id == company_id).order_by(User.id).limit(settings.JOB_CHUNK_SIZE)
+        )
+        user_ids = user_ids.all()
+        if not user_ids:
+            break
+        await delete_tasks_of(ctx, user_ids, counts)
+        await delete_users(ctx, user_ids, counts)
+    await ctx.db.execute(delete(Company).where(Company.id == company_id))
+    await ctx.progress(**counts)
+    await response_cache.invalidate("companies")
+    return counts
+
+
+@job_queue.handler("delete_user")
+async def delete_user(ctx: JobContext, user_id: int) -> dict:
+    ''' Delete a user and their tasks '''
+    counts = {"users": 0, "tasks": 0}
+    await delete_tasks_of(ctx, [user_id], counts)
+    await delete_users(ctx, [user_id], counts)
+    return counts
+
+
+@job_queue.handler("reassign_tasks")
+async def reassign_tasks(ctx: JobContext, from_user_id: int, to_user_id: int) -> dict:
+    ''' Move every task of one user to another '''
+    counts = {"tasks": 0}
+    if from_user_id == to_user_id:
+        # every chunk would match the same tasks again, forever
+        return counts
+    while True:
+        chunk = select(Task.id).where(Task.user_id == from_user_id).limit(settings.JOB_CHUNK_SIZE)
+        result = await ctx.db.execute(
+            update(Task).where(Task.id.in_(chunk))
+            .values(user_id=to_user_id, version=Task.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if not result.rowcount:
+            return counts
+        counts["tasks"] += result.rowcount
+        await ctx.progress(**counts)
+        await response_cache.invalidate("tasks")
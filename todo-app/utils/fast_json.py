@@ -0,0 +1,47 @@
+''' Fast JSON path: plain column rows encoded with orjson, no ORM objects and no Pydantic validation '''
+import types
+from typing import Any, Union, get_args, get_origin
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy import Boolean, Integer, case, func, null, type_coerce
+
+
+class ORJSONResponse(JSONResponse):
+    ''' JSON response rendered with orjson, several times faster than the stdlib encoder '''
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+
+def is_bool_field(annotation) -> bool:
+    ''' bool or Optional[bool] '''
+    if annotation is bool:
+        return True
+    if get_origin(annotation) in (Union, types.UnionType):
+        return bool in get_args(annotation)
+    return False
+
+
+def schema_columns(model, schema: type[BaseModel]) -> list:
+    ''' Columns of `model` that make up `schema`, to select as plain rows.
+
+    Boolean fields stored in non-boolean columns are converted so the database
+    driver returns True/False, matching what the Pydantic schema would have
+    produced: integers (e.g. `is_active`) are coerced, text (e.g. task `status`,
+    stored as '1' / '0') is compared in SQL, since any non-empty string is truthy.
+    '''
+    columns = []
+    for name, field in schema.model_fields.items():
+        column = getattr(model, name)
+        if is_bool_field(field.annotation) and not isinstance(column.type, Boolean):
+            if isinstance(column.type, Integer):
+                column = type_coerce(column, Boolean)
+            else:
+                column = case(
+                    (column.is_(None), null()),
+                    (func.lower(column).in_(["1", "true", "t"]), True),
+                    else_=False,
+                )
+            column = column.label(name)
+        columns.append(column)
+    return columns
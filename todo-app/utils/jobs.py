@@ -0,0 +1,165 @@
+''' Background jobs: a table of queued work and an asyncio worker pool running it '''
+import asyncio
+import logging
+import time
+from fastapi import Response
+from sqlalchemy import and_, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from models.base import Job
+from schemas import job as schemas_job
+
+logger = logging.getLogger(__name__)
+
+
+class JobContext:
+    ''' What a running handler gets: its own session, and a way to report progress '''
+    def __init__(self, queue: "JobQueue", db: AsyncSession, job_id: int):
+        self.queue = queue
+        self.db = db
+        self.job_id = job_id
+
+    async def progress(self, **result):
+        ''' Record progress, renew the lease and commit the handler's work so far '''
+        now = int(time.time())
+        await self.db.execute(
+            update(Job).where(Job.id == self.job_id)
+            .values(result=result, locked_until=now + self.queue.lease_seconds, updated_at=now)
+        )
+        await self.db.commit()
+
+
+class JobQueue:
+    ''' Jobs are rows of the `jobs` table, so they survive restarts and any
+    worker process can run them. A worker claims the oldest queued job with a
+    single UPDATE ... RETURNING, which also takes a lease on it: a job whose
+    worker died is claimed again once the lease runs out. Handlers may thus
+    run more than once and must be idempotent; long ones should commit in
+    chunks through `JobContext.progress`, which also renews the lease.
+    '''
+    def __init__(self, workers: int, poll_interval: float, lease_seconds: int, max_attempts: int):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.handlers = {}
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._stopping = False
+
+    def handler(self, kind: str):
+        ''' Register a coroutine `handler(ctx, **payload) -> dict` for jobs of `kind` '''
+        def register(func):
+            func.job_kind = kind
+            self.handlers[kind] = func
+            return func
+        return register
+
+    async def enqueue(self, db: AsyncSession, handler, **payload) -> Job:
+        ''' Queue `handler(ctx, **payload)` and commit; returns the job row '''
+        now = int(time.time())
+        job = await db.scalar(
+            insert(Job).values(
+                kind=handler.job_kind, payload=payload, status="queued", attempts=0,
+                created_at=now, updated_at=now,
+            ).returning(Job)
+        )
+        await db.commit()
+        self._wakeup.set()
+        return job
+
+    async def claim(self, db: AsyncSession) -> Job | None:
+        ''' Take the oldest claimable job, None if there is none (or another worker won it) '''
+        now = int(time.time())
+        claimable = or_(Job.status == "queued", and_(Job.status == "running", Job.locked_until < now))
+        next_id = select(Job.id).where(claimable).order_by(Job.id).limit(1).scalar_subquery()
+        job = await db.scalar(
+            update(Job).where(Job.id == next_id, claimable)
+            .values(status="running", attempts=Job.attempts + 1, locked_until=now + self.lease_seconds,
+                    updated_at=now)
+            .returning(Job)
+        )
+        await db.commit()
+        return job
+
+    async def run_next(self, session_factory) -> bool:
+        ''' Claim and run one job; False if there was nothing to do '''
+        async with session_factory() as db:
+            job = await self.claim(db)
+        if job is None:
+            return False
+        async with session_factory() as db:
+            try:
+                handler = self.handlers.get(job.kind)
+                if handler is None:
+                    raise LookupError(f"No handler for jobs of kind {job.kind!r}")
+                result = await handler(JobContext(self, db, job.id), **job.payload)
+                values = {"status": "done", "result": result, "error": None}
+            except asyncio.CancelledError:
+                # shutting down: hand the job back at once instead of leaving it leased,
+                # the interrupted run does not count as an attempt
+                await db.rollback()
+                await db.execute(
+                    update(Job).where(Job.id == job.id)
+                    .values(status="queued", attempts=Job.attempts - 1, locked_until=None,
+                            updated_at=int(time.time()))
+                )
+                await db.commit()
+                raise
+            except Exception as e:
+                await db.rollback()
+                logger.exception("Job %s (%s) failed on attempt %s", job.id, job.kind, job.attempts)
+                values = {"status": "queued" if job.attempts < self.max_attempts else "failed", "error": str(e)}
+            await db.execute(
+                update(Job).where(Job.id == job.id)
+                .values(**values, locked_until=None, updated_at=int(time.time()))
+            )
+            await db.commit()
+        return True
+
+    async def work(self, session_factory):
+        ''' Worker loop: run jobs while there are any, then wait to be woken or for the next poll '''
+        while not self._stopping:
+            try:
+                if await self.run_next(session_factory):
+                    continue
+            except Exception as e:  # database unavailable: back off and retry
+                logger.warning("Job worker error: %s", e)
+            self._wakeup.clear()
+            if self._stopping:
+                return
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, session_factory):
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self.work(session_factory)) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float | None = None):
+        ''' Claim no more jobs and give running ones up to `timeout` seconds to finish.
+        Those still running are then cancelled and queued again for any worker. '''
+        self._stopping = True
+        self._wakeup.set()
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+def accepted(response: Response, job: Job, message: str) -> schemas_job.JobAccepted:
+    ''' Body of a 202 handing the work to `job`, whose status is at the Location URL '''
+    response.status_code = 202
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return schemas_job.JobAccepted(message=message, job=schemas_job.Job.model_validate(job, from_attributes=True))
+
+
+job_queue = JobQueue(
+    workers=settings.JOB_WORKERS,
+    poll_interval=settings.JOB_POLL_SECONDS,
+    lease_seconds=settings.JOB_LEASE_SECONDS,
+    max_attempts=settings.JOB_MAX_ATTEMPTS,
+)
@@ -0,0 +1,62 @@
+''' Access token keys: built once, looked up by key id on every decode '''
+import hashlib
+from pathlib import Path
+from jose import jwk, jwt
+from jose.exceptions import JWTError
+from config import settings
+
+
+def key_id(material: bytes) -> str:
+    return hashlib.sha256(material).hexdigest()[:16]
+
+
+class KeySet:
+    ''' The key new tokens are signed with, plus every key still accepted, by key id.
+
+    jose accepts prepared key objects, so the secret or PEM is parsed once here
+    instead of on every encode and decode. Asymmetric algorithms (RS*, ES*)
+    verify with the public half only. To rotate, sign with the new key and keep
+    the old one as a verification key until the tokens it signed have expired.
+    '''
+    def __init__(self, algorithm: str, signing_key: str, verification_keys: list[str] = ()):
+        self.algorithm = algorithm
+        self.symmetric = algorithm.startswith("HS")
+        self.signing_key = jwk.construct(signing_key, algorithm)
+        self.verification_keys = {}
+        for material in [signing_key, *verification_keys]:
+            kid, key = self._verifier(material)
+            self.verification_keys[kid] = key
+        self.signing_kid = self._verifier(signing_key)[0]
+
+    def _verifier(self, material: str):
+        key = jwk.construct(material, self.algorithm)
+        if self.symmetric:
+            return key_id(material.encode()), key
+        public = key.public_key()
+        return key_id(public.to_pem()), public
+
+    def encode(self, claims: dict) -> str:
+        return jwt.encode(claims, self.signing_key, algorithm=self.algorithm, headers={"kid": self.signing_kid})
+
+    def decode(self, token: str) -> dict:
+        ''' Verified claims of `token`; JWTError if it is malformed, expired or signed by an unknown key '''
+        # tokens issued before key ids existed carry none, they can only be from the signing key
+        kid = jwt.get_unverified_header(token).get("kid", self.signing_kid)
+        key = self.verification_keys.get(kid)
+        if key is None:
+            raise JWTError("Unknown signing key")
+        return jwt.decode(token, key, algorithms=[self.algorithm])
+
+
+def load_key_set() -> KeySet:
+    ''' Key set from settings: JWT_SECRET_KEY for HS* algorithms, PEM files otherwise '''
+    if settings.JWT_ALGORITHM.startswith("HS"):
+        return KeySet(settings.JWT_ALGORITHM, settings.JWT_SECRET_KEY, settings.JWT_PREVIOUS_SECRET_KEYS)
+    return KeySet(
+        settings.JWT_ALGORITHM,
+        Path(settings.JWT_PRIVATE_KEY_FILE).read_text(),
+        [Path(path).read_text() for path in settings.JWT_PUBLIC_KEY_FILES],
+    )
+
+
+key_set = load_key_set()
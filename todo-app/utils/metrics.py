@@ -0,0 +1,226 @@
+''' Request and database metrics, exposed in the Prometheus text format '''
+import threading
+import time
+from fastapi import Request
+from sqlalchemy.engine import Engine
+from utils.password import password_hasher
+from utils.rate_limit import login_rate_limiter
+from utils.profiling import RequestStats, request_stats, statement_observers
+
+# Prometheus' default latency buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    ''' A named metric with one series per combination of label values '''
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._series.get(labels, 0)
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self._series[labels] = value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            series = list(self._series.items())
+        return self.header() + [
+            f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}"
+            for labels, value in series
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, *labels, value: float):
+        with self._lock:
+            series = self._series.setdefault(labels, [[0] * len(self.buckets), 0, 0.0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += 1
+            series[2] += value
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return series[1] if series else 0
+
+    def render(self) -> list[str]:
+        with self._lock:
+            series = [(labels, list(counts), count, total) for labels, (counts, count, total) in self._series.items()]
+        lines = self.header()
+        for labels, counts, count, total in series:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                le = format_labels(self.labelnames, labels, f'le="{format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = format_labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {count}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    ''' Every metric of the process, plus callbacks refreshing gauges at scrape time '''
+    def __init__(self):
+        self.metrics: list[Metric] = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        for collect in self.collectors:
+            collect()
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.register(Counter(
+    "http_requests_total", "HTTP requests handled", ("method", "route", "status")))
+HTTP_LATENCY = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route")))
+HTTP_IN_PROGRESS = registry.register(Gauge(
+    "http_requests_in_progress", "HTTP requests being handled", ("method",)))
+HTTP_DB_QUERIES = registry.register(Histogram(
+    "http_request_db_queries", "Database queries per HTTP request", ("method", "route"), QUERY_COUNT_BUCKETS))
+HTTP_DB_SECONDS = registry.register(Histogram(
+    "http_request_db_seconds", "Database time per HTTP request", ("method", "route")))
+DB_QUERIES = registry.register(Counter("db_queries_total", "Database statements executed"))
+DB_QUERY_SECONDS = registry.register(Histogram("db_query_duration_seconds", "Database statement latency"))
+DB_POOL_CHECKOUT_SECONDS = registry.register(Histogram(
+    "db_pool_checkout_seconds", "Time spent waiting for a pooled database connection"))
+DB_POOL_CHECKED_OUT = registry.register(Gauge(
+    "db_pool_checked_out", "Database connections currently checked out", ("engine",)))
+
+PASSWORD_HASH_RUNNING = registry.register(Gauge(
+    "password_hash_running", "Password hashes and verifications running on a worker thread"))
+PASSWORD_HASH_PENDING = registry.register(Gauge(
+    "password_hash_pending", "Password hashes and verifications waiting for a worker thread"))
+PASSWORD_HASH_COMPLETED = registry.register(Counter(
+    "password_hash_completed_total", "Password hashes and verifications finished"))
+PASSWORD_HASH_REJECTED = registry.register(Counter(
+    "password_hash_rejected_total", "Password hashes and verifications refused with a 503 because the queue was full"))
+
+LOGIN_RATE_LIMITED = registry.register(Counter(
+    "login_rate_limited_total", "Login attempts refused with a 429 by the rate limiter"))
+
+
+def observe_statement(elapsed: float):
+    DB_QUERIES.inc()
+    DB_QUERY_SECONDS.observe(value=elapsed)
+
+
+statement_observers.append(observe_statement)
+
+
+def track_pool(engine: Engine, name: str):
+    ''' Report the connections checked out of `engine`'s pool as `db_pool_checked_out{engine=name}` '''
+    if hasattr(engine.pool, "checkedout"):
+        registry.collectors.append(lambda: DB_POOL_CHECKED_OUT.set(name, value=engine.pool.checkedout()))
+
+
+def collect_password_hasher():
+    ''' Copy the hasher's own counters, kept without locking on the event loop, at scrape time '''
+    stats = password_hasher.stats()
+    PASSWORD_HASH_RUNNING.set(value=stats["in_flight"])
+    PASSWORD_HASH_PENDING.set(value=stats["queued"])
+    PASSWORD_HASH_COMPLETED.set(value=stats["completed"])
+    PASSWORD_HASH_REJECTED.set(value=stats["rejected"])
+
+
+registry.collectors.append(collect_password_hasher)
+registry.collectors.append(lambda: LOGIN_RATE_LIMITED.set(value=login_rate_limiter.rejected))
+
+
+class TimedCheckout:
+    ''' Pool mixin recording how long each checkout waits for a connection,
+    including opening a new one and the pre-ping '''
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(value=time.perf_counter() - start)
+
+
+def route_template(request: Request) -> str:
+    ''' Path template of the route that handled `request` (e.g. "/tasks/{task_id}"),
+    so label values stay bounded no matter which IDs are requested '''
+    route = request.scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+async def record_metrics(request: Request, call_next):
+    ''' Middleware: count and time requests per route, along with the database
+    queries each one ran. The route is only known once the router has matched,
+    so the in-flight gauge is per method. '''
+    method = request.method
+    stats = request_stats.get() or RequestStats()
+    HTTP_IN_PROGRESS.inc(method)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = route_template(request)
+        HTTP_LATENCY.observe(method, route, value=time.perf_counter() - start)
+        HTTP_IN_PROGRESS.dec(method)
+        HTTP_REQUESTS.inc(method, route, str(status_code))
+        HTTP_DB_QUERIES.observe(method, route, value=stats.queries)
+        HTTP_DB_SECONDS.observe(method, route, value=stats.db_seconds)
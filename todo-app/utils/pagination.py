@@ -0,0 +1,130 @@
+''' Keyset (cursor) pagination helpers shared by the list endpoints '''
+import base64
+import binascii
+import json
+from collections.abc import Mapping
+from typing import Any
+from fastapi import HTTPException, Query
+from sqlalchemy import Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class PageParams:
+    ''' Query parameters for a cursor-paginated list endpoint '''
+    def __init__(
+        self,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Page size"),
+        after: str | None = Query(None, description="Opaque cursor returned as `next_cursor`"),
+    ):
+        self.limit = limit
+        self.after = after
+
+
+def encode_cursor(values: list[Any]) -> str:
+    ''' Encode the sort key of the last row of a page into an opaque cursor '''
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list[Any]:
+    ''' Decode a cursor produced by `encode_cursor`, 400 if it was tampered with '''
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise HTTPException(400, detail="Invalid cursor")
+    if not isinstance(values, list):
+        raise HTTPException(400, detail="Invalid cursor")
+    return values
+
+
+def sort_blocks(column, id_column, descending: bool) -> list[tuple]:
+    ''' Split a sort on a nullable column into (where, order_by) blocks.
+
+    NULLs come first in ascending order and last in descending order. Each
+    block on its own is a plain index range scan, where a single query with
+    `... OR column IS NULL` would make the database sort every match.
+    '''
+    id_order = id_column.desc() if descending else id_column.asc()
+    column_order = column.desc() if descending else column.asc()
+    nulls = (column.is_(None), [id_order])
+    values = (column.is_not(None), [column_order, id_order])
+    return [values, nulls] if descending else [nulls, values]
+
+
+async def paginate(
+    db: AsyncSession,
+    stmt: Select,
+    model,
+    params: PageParams,
+    sort_column=None,
+    descending: bool = False,
+    mappings: bool = False,
+) -> dict:
+    ''' Return one page of `stmt` ordered by `sort_column`, then primary key.
+
+    Seeks past the cursor (the sort key of the last row already seen) instead
+    of using OFFSET, so every page is an index range scan no matter how deep
+    the client is. One extra row is fetched to know whether another page exists.
+    With `mappings`, `stmt` selects columns and rows come back as mappings.
+    '''
+    id_column = model.id
+
+    def fetch(result):
+        return result.mappings().all() if mappings else result.scalars().all()
+    after = None
+    if params.after is not None:
+        after = decode_cursor(params.after)
+        if len(after) != (1 if sort_column is None else 2) or not isinstance(after[-1], int):
+            raise HTTPException(400, detail="Invalid cursor")
+        # the only sort column is Task.priority, a nullable integer
+        if sort_column is not None and not (after[0] is None or isinstance(after[0], int)):
+            raise HTTPException(400, detail="Invalid cursor")
+
+    def seek_id(last_id):
+        return id_column < last_id if descending else id_column > last_id
+
+    if sort_column is None:
+        if after is not None:
+            stmt = stmt.where(seek_id(after[0]))
+        order_by = id_column.desc() if descending else id_column.asc()
+        result = await db.execute(stmt.order_by(order_by).limit(params.limit + 1))
+        rows = fetch(result)
+    else:
+        blocks = sort_blocks(sort_column, id_column, descending)
+        start = 0
+        seek = None
+        if after is not None:
+            value, last_id = after
+            start = 0 if (value is None) != descending else 1
+            if value is None:
+                seek = seek_id(last_id)
+            elif descending:
+                seek = tuple_(sort_column, id_column) < tuple_(value, last_id)
+            else:
+                seek = tuple_(sort_column, id_column) > tuple_(value, last_id)
+        rows = []
+        for where, order_by in blocks[start:]:
+            block = stmt.where(where)
+            if seek is not None:
+                block, seek = block.where(seek), None
+            result = await db.execute(block.order_by(*order_by).limit(params.limit + 1 - len(rows)))
+            rows += fetch(result)
+            if len(rows) > params.limit:
+                break
+
+    next_cursor = None
+    if len(rows) > params.limit:
+        rows = rows[:params.limit]
+        last = rows[-1]
+        if not isinstance(last, Mapping):
+            last = {"id": last.id} if sort_column is None else {
+                "id": last.id, sort_column.key: getattr(last, sort_column.key)
+            }
+        key = [last["id"]] if sort_column is None else [last[sort_column.key], last["id"]]
+        next_cursor = encode_cursor(key)
+    return {"items": rows, "next_cursor": next_cursor}
+
@@ -0,0 +1,116 @@
+''' Password hashing service: runs bcrypt off the event loop in a bounded worker pool '''
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from config import settings
+from utils.profiling import timed
+
+# every scheme a stored hash may use; the configured one comes first, the others are deprecated
+SCHEMES = ("bcrypt", "argon2")
+
+
+def build_context(scheme: str) -> CryptContext:
+    ''' Context hashing with `scheme` and the configured cost, verifying every known scheme.
+    Hashes of another scheme or cost are flagged by `needs_update`. '''
+    if scheme not in SCHEMES:
+        raise ValueError(f"Unknown PASSWORD_SCHEME {scheme!r}, expected one of {', '.join(SCHEMES)}")
+    if scheme == "argon2":
+        from passlib.hash import argon2
+        if not argon2.has_backend():
+            raise RuntimeError("PASSWORD_SCHEME=argon2 needs the `argon2-cffi` package")
+    return CryptContext(
+        schemes=[scheme, *(other for other in SCHEMES if other != scheme)],
+        deprecated="auto",
+        # min == max: hashes made with a higher or lower cost are both brought in line
+        bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+        bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+        bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+        argon2__time_cost=settings.ARGON2_TIME_COST,
+        argon2__memory_cost=settings.ARGON2_MEMORY_COST_KB,
+        argon2__parallelism=settings.ARGON2_PARALLELISM,
+    )
+
+
+pwd_context = build_context(settings.PASSWORD_SCHEME)
+
+
+class PasswordHasher:
+    ''' Hash and verify passwords in a thread pool.
+
+    bcrypt releases the GIL while it works, so a thread pool gives real
+    parallelism while the event loop keeps serving other requests. Calls
+    beyond `max_pending` (running + queued) are refused with a 503 so a login
+    storm sheds load instead of building an unbounded backlog.
+    '''
+    def __init__(self, context: CryptContext, workers: int, max_pending: int):
+        self.context = context
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._dummy_hash = None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+
+    async def _run(self, func, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy, please retry later",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        ''' Hash a plain password '''
+        with timed("hash"):
+            return await self._run(self.context.hash, password)
+
+    async def verify(self, plain: str, hashed: str) -> bool:
+        ''' Check a plain password against a stored hash '''
+        return await self._run(self.context.verify, plain, hashed)
+
+    def needs_update(self, hashed: str) -> bool:
+        ''' Whether `hashed` uses an outdated scheme or cost; cheap, no hashing '''
+        try:
+            return self.context.needs_update(hashed)
+        except ValueError:
+            # not a hash this context knows, it can't have verified either
+            return False
+
+    async def dummy_verify(self, plain: str) -> bool:
+        ''' Verify against a throwaway hash, so a login for an unknown username
+        costs as much as one for a real user and doesn't reveal which it was '''
+        if self._dummy_hash is None:
+            self._dummy_hash = await self._run(self.context.hash, "dummy password")
+        await self._run(self.context.verify, plain, self._dummy_hash)
+        return False
+
+    def stats(self) -> dict:
+        ''' Queue depth and throughput counters for monitoring '''
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "in_flight": min(self.pending, self.workers),
+            "queued": max(self.pending - self.workers, 0),
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        ''' Stop the worker threads once outstanding work is done '''
+        self._executor.shutdown(wait=True)
+
+
+password_hasher = PasswordHasher(
+    pwd_context,
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+)
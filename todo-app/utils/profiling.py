@@ -0,0 +1,188 @@
+''' Per-request profiling: database time, slow-query log and Server-Timing breakdown '''
+import functools
+import inspect
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from fastapi import Request
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# statements worth an EXPLAIN when slow; running one for a write would risk side effects
+EXPLAINABLE = ("SELECT", "WITH")
+EXPLAIN_PREFIX = {"sqlite": "EXPLAIN QUERY PLAN ", "postgresql": "EXPLAIN "}
+MAX_LOGGED_CHARS = 1000
+
+
+class RequestStats:
+    ''' Where the current request spent its time '''
+    def __init__(self, profile: bool = False):
+        self.profile = profile
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.phases: dict[str, float] = {}
+        self.statements: list[tuple[float, str]] = []
+        self.endpoint_returned: float | None = None
+
+    def add(self, phase: str, seconds: float):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+
+request_stats: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+# callbacks(elapsed seconds) run for every statement, e.g. to feed metrics
+statement_observers = []
+
+
+@contextmanager
+def timed(phase: str):
+    ''' Add the time spent in the block to `phase` of the current request '''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = request_stats.get()
+        if stats is not None:
+            stats.add(phase, time.perf_counter() - start)
+
+
+def timed_phase(phase: str):
+    ''' Decorator form of `timed` for coroutine functions (dependencies included) '''
+    def decorate(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with timed(phase):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def shorten(value) -> str:
+    text = str(value)
+    return text if len(text) <= MAX_LOGGED_CHARS else text[:MAX_LOGGED_CHARS] + "..."
+
+
+def explain(conn, statement: str, parameters) -> list[str]:
+    ''' Query plan of `statement`, run on a separate cursor of the same connection '''
+    prefix = EXPLAIN_PREFIX.get(conn.dialect.name)
+    if prefix is None:
+        return []
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return [str(row[-1]) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def log_slow_query(conn, statement: str, parameters, executemany: bool, elapsed: float):
+    plan = []
+    if settings.SLOW_QUERY_EXPLAIN and not executemany and statement.lstrip().upper().startswith(EXPLAINABLE):
+        try:
+            plan = explain(conn, statement, parameters)
+        except Exception as e:  # the plan is a diagnostic, never fail the query over it
+            plan = [f"EXPLAIN failed: {e}"]
+    logger.warning(
+        "Slow query (%.1f ms): %s | parameters: %s%s",
+        elapsed * 1000,
+        shorten(" ".join(statement.split())),
+        shorten(parameters),
+        "".join(f"\n    {line}" for line in plan),
+    )
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # statements on one connection never overlap, so a single slot is enough
+    conn.info["query_start"] = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop("query_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    for observe in statement_observers:
+        observe(elapsed)
+    stats = request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        if stats.profile:
+            stats.statements.append((elapsed, statement))
+    if settings.SLOW_QUERY_MS > 0 and elapsed * 1000 >= settings.SLOW_QUERY_MS:
+        log_slow_query(conn, statement, parameters, executemany, elapsed)
+
+
+def instrument_engine(engine: Engine):
+    ''' Time every statement run on `engine` (for an AsyncEngine, its sync_engine) '''
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+def mark_return(endpoint):
+    ''' Wrap an async endpoint to note when it returns: what happens between
+    then and the response leaving the app is validation and JSON encoding '''
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        result = await endpoint(*args, **kwargs)
+        stats = request_stats.get()
+        if stats is not None:
+            stats.endpoint_returned = time.perf_counter()
+        return result
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    ''' APIRoute whose endpoint reports when it returns, for the "serialize" timing '''
+    def __init__(self, path: str, endpoint, **kwargs):
+        if inspect.iscoroutinefunction(endpoint):
+            endpoint = mark_return(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+def wants_profile(request: Request) -> bool:
+    if settings.PROFILE_REQUESTS:
+        return True
+    return settings.PROFILE_HEADER_ALLOWED and request.headers.get(settings.PROFILE_HEADER, "") in ("1", "true")
+
+
+def server_timing(stats: RequestStats, total: float) -> str:
+    ''' Server-Timing header value, durations in milliseconds. Phases may overlap:
+    auth includes the queries it runs, which also count towards db. '''
+    entries = [f'db;dur={stats.db_seconds * 1000:.2f};desc="{stats.queries} queries"']
+    entries += [f"{phase};dur={seconds * 1000:.2f}" for phase, seconds in stats.phases.items()]
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+async def profile_requests(request: Request, call_next):
+    ''' Middleware: collect per-request timings; for profiled requests return them
+    in a Server-Timing header and log the request's statements '''
+    stats = RequestStats(profile=wants_profile(request))
+    token = request_stats.set(stats)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        request_stats.reset(token)
+    end = time.perf_counter()
+    if stats.endpoint_returned is not None:
+        stats.add("serialize", end - stats.endpoint_returned)
+    if stats.profile:
+        response.headers["Server-Timing"] = server_timing(stats, end - start)
+        logger.info(
+            "Profile %s %s: %s%s",
+            request.method,
+            request.url.path,
+            response.headers["Server-Timing"],
+            "".join(
+                f"\n    {elapsed * 1000:.2f} ms  {shorten(' '.join(statement.split()))}"
+                for elapsed, statement in stats.statements
+            ),
+        )
+    return response
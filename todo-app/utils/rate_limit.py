@@ -0,0 +1,113 @@
+''' Login throttling: sliding-window attempt limits per username and per client IP '''
+import time
+import uuid
+from collections import OrderedDict, deque
+from fastapi import HTTPException
+from config import settings
+
+
+class InMemoryBackend:
+    ''' Process-local backend: the attempt timestamps of each key, in a bounded LRU
+    so a flood of made-up usernames can't grow it without limit '''
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._attempts: OrderedDict[str, deque] = OrderedDict()
+
+    async def hit(self, key: str, limit: int, window: float) -> float:
+        now = time.monotonic()
+        attempts = self._attempts.get(key)
+        if attempts is None:
+            attempts = self._attempts[key] = deque()
+        self._attempts.move_to_end(key)
+        while attempts and attempts[0] <= now - window:
+            attempts.popleft()
+        if len(attempts) >= limit:
+            return attempts[0] + window - now
+        attempts.append(now)
+        while len(self._attempts) > self.max_keys:
+            self._attempts.popitem(last=False)
+        return 0.0
+
+    async def clear(self):
+        self._attempts.clear()
+
+
+class RedisBackend:
+    ''' Backend on any Redis-compatible asyncio client, shared by every worker
+    so the limits hold for the whole deployment. One sorted set per key. '''
+    def __init__(self, client, prefix: str = "todo:ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+
+    async def hit(self, key: str, limit: int, window: float) -> float:
+        now = time.time()
+        name = self.prefix + key
+        member = f"{now}:{uuid.uuid4().hex}"
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zremrangebyscore(name, 0, now - window)
+            pipe.zadd(name, {member: now})
+            pipe.zcard(name)
+            pipe.zrange(name, 0, 0, withscores=True)
+            pipe.expire(name, int(window) + 1)
+            _, _, count, oldest, _ = await pipe.execute()
+        if count > limit:
+            # rejected attempts don't count towards the window
+            await self.client.zrem(name, member)
+            return max(oldest[0][1] + window - now, 0.0)
+        return 0.0
+
+    async def clear(self):
+        keys = [key async for key in self.client.scan_iter(match=f"{self.prefix}*")]
+        if keys:
+            await self.client.delete(*keys)
+
+
+class LoginRateLimiter:
+    ''' Refuse login attempts beyond `per_username` / `per_ip` in any `window` seconds.
+
+    Checked before the user lookup and the password hash, so an attacker
+    hammering the login endpoint costs a dict (or Redis) lookup per attempt
+    instead of a bcrypt verification. A limit of 0 turns that check off.
+    '''
+    def __init__(self, backend, per_username: int, per_ip: int, window: float):
+        self.backend = backend
+        self.per_username = per_username
+        self.per_ip = per_ip
+        self.window = window
+        self.rejected = 0
+
+    async def check(self, username: str, client_ip: str | None):
+        ''' Count one attempt, 429 with Retry-After if either limit is exceeded '''
+        checks = [("user:" + username.lower(), self.per_username)]
+        if client_ip:
+            checks.append(("ip:" + client_ip, self.per_ip))
+        for key, limit in checks:
+            if limit <= 0:
+                continue
+            retry_after = await self.backend.hit(key, limit, self.window)
+            if retry_after > 0:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many login attempts, please retry later",
+                    headers={"Retry-After": str(max(1, round(retry_after)))},
+                )
+
+
+def build_backend():
+    ''' Backend selected by LOGIN_RATE_LIMIT_BACKEND ("memory" or "redis") '''
+    if settings.LOGIN_RATE_LIMIT_BACKEND == "redis":
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("LOGIN_RATE_LIMIT_BACKEND=redis needs the `redis` package") from e
+        return RedisBackend(redis.from_url(settings.LOGIN_RATE_LIMIT_REDIS_URL))
+    return InMemoryBackend(settings.LOGIN_RATE_LIMIT_MAX_KEYS)
+
+
+login_rate_limiter = LoginRateLimiter(
+    build_backend(),
+    per_username=settings.LOGIN_ATTEMPTS_PER_USERNAME,
+    per_ip=settings.LOGIN_ATTEMPTS_PER_IP,
+    window=settings.LOGIN_RATE_WINDOW_SECONDS,
+)
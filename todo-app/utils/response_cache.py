@@ -0,0 +1,169 @@
+''' Response cache for read endpoints, with ETags derived from per-entity version counters '''
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from config import settings
+from utils.profiling import timed
+
+
+class InMemoryBackend:
+    ''' Process-local backend: an LRU of response bodies and a dict of version counters.
+
+    Other workers never see this process's invalidations. So that they cannot serve
+    a stale body or answer 304 for it indefinitely, bodies expire after `ttl` seconds
+    and each entity's version moves on by itself every `ttl` seconds, which changes
+    its ETags. With several workers a write may thus take up to `ttl` to show
+    everywhere; RedisBackend shares invalidations instead.
+    '''
+    shared = False
+
+    def __init__(self, max_entries: int, ttl: int | None = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._bodies: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._versions: dict[str, int] = {}
+        self._rollover: dict[str, float] = {}
+
+    async def get(self, key: str) -> bytes | None:
+        entry = self._bodies.get(key)
+        if entry is None:
+            return None
+        expires_at, body = entry
+        if expires_at <= time.monotonic():
+            del self._bodies[key]
+            return None
+        self._bodies.move_to_end(key)
+        return body
+
+    async def set(self, key: str, body: bytes, ttl: int):
+        # entries are keyed by version, so stale ones are never read again and age out of the LRU
+        self._bodies[key] = (time.monotonic() + ttl, body)
+        self._bodies.move_to_end(key)
+        while len(self._bodies) > self.max_entries:
+            self._bodies.popitem(last=False)
+
+    async def versions(self, entities: list[str]) -> list[int]:
+        if self.ttl:
+            now = time.monotonic()
+            for entity in entities:
+                rollover = self._rollover.get(entity)
+                if rollover is None or rollover <= now:
+                    if rollover is not None:
+                        await self.bump(entity)
+                    self._rollover[entity] = now + self.ttl
+        return [self._versions.get(entity, 0) for entity in entities]
+
+    async def bump(self, entity: str):
+        self._versions[entity] = self._versions.get(entity, 0) + 1
+
+    async def clear(self):
+        self._bodies.clear()
+        self._versions.clear()
+        self._rollover.clear()
+
+
+class RedisBackend:
+    ''' Backend on any Redis-compatible asyncio client (redis.asyncio, fakeredis, Valkey...),
+    shared by every worker so one invalidation reaches all of them '''
+    shared = True
+
+    def __init__(self, client, prefix: str = "todo:cache:"):
+        self.client = client
+        self.prefix = prefix
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.client.get(f"{self.prefix}body:{key}")
+
+    async def set(self, key: str, body: bytes, ttl: int):
+        await self.client.set(f"{self.prefix}body:{key}", body, ex=ttl)
+
+    async def versions(self, entities: list[str]) -> list[int]:
+        values = await self.client.mget([f"{self.prefix}version:{entity}" for entity in entities])
+        return [int(value or 0) for value in values]
+
+    async def bump(self, entity: str):
+        await self.client.incr(f"{self.prefix}version:{entity}")
+
+    async def clear(self):
+        keys = [key async for key in self.client.scan_iter(match=f"{self.prefix}*")]
+        if keys:
+            await self.client.delete(*keys)
+
+
+class ResponseCache:
+    ''' Serve GET responses from cache and answer conditional requests.
+
+    Each cached response depends on a few entities ("tasks", "users", ...).
+    Its ETag hashes the request URL with the current version of those
+    entities, so a matching If-None-Match gets a 304 after a single counter
+    lookup, without touching the database. Write handlers call `invalidate`
+    after committing, which bumps the version and so changes every ETag.
+    '''
+    def __init__(self, backend, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+        self._adapters: dict[Any, TypeAdapter] = {}
+
+    def adapter(self, schema) -> TypeAdapter:
+        if schema not in self._adapters:
+            self._adapters[schema] = TypeAdapter(schema)
+        return self._adapters[schema]
+
+    async def etag(self, request: Request, entities: list[str]) -> str:
+        versions = await self.backend.versions(entities)
+        key = f"{request.url.path}?{request.url.query}|" + ",".join(
+            f"{entity}:{version}" for entity, version in zip(entities, versions)
+        )
+        return '"' + hashlib.sha1(key.encode()).hexdigest() + '"'
+
+    async def respond(
+        self,
+        request: Request,
+        entities: list[str],
+        schema,
+        produce: Callable[[], Awaitable[Any]],
+        exclude_unset: bool = False,
+        store: bool = True,
+    ) -> Response:
+        ''' Response for a cacheable GET: 304, cached body, or `produce()` serialized with `schema`.
+        Pass `store=False` when `produce()` reads a replica: its rows may predate the
+        version in the ETag, so the body is neither cached nor tagged for revalidation '''
+        etag = await self.etag(request, entities)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if_none_match = request.headers.get("if-none-match", "")
+        if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+        body = await self.backend.get(etag)
+        if body is None:
+            adapter = self.adapter(schema)
+            content = await produce()
+            with timed("serialize"):
+                body = adapter.dump_json(
+                    adapter.validate_python(content, from_attributes=True), exclude_unset=exclude_unset
+                )
+            if not store:
+                return Response(content=body, media_type="application/json", headers={"Cache-Control": "no-cache"})
+            await self.backend.set(etag, body, self.ttl)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    async def invalidate(self, *entities: str):
+        ''' Mark everything cached for these entities as stale '''
+        for entity in entities:
+            await self.backend.bump(entity)
+
+
+def build_backend():
+    ''' Backend selected by RESPONSE_CACHE_BACKEND ("memory" or "redis") '''
+    if settings.RESPONSE_CACHE_BACKEND == "redis":
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("RESPONSE_CACHE_BACKEND=redis needs the `redis` package") from e
+        return RedisBackend(redis.from_url(settings.RESPONSE_CACHE_REDIS_URL))
+    return InMemoryBackend(settings.RESPONSE_CACHE_MAX_ENTRIES, settings.RESPONSE_CACHE_TTL_SECONDS)
+
+
+response_cache = ResponseCache(build_backend(), settings.RESPONSE_CACHE_TTL_SECONDS)
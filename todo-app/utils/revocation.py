@@ -0,0 +1,96 @@
+''' Revoked token IDs: an in-memory map checked on every request, backed by a table '''
+import asyncio
+import logging
+import time
+from threading import Lock
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from models.base import RevokedToken
+
+logger = logging.getLogger(__name__)
+
+
+class RevocationList:
+    ''' Token IDs (jti) revoked before they expire.
+
+    `is_revoked` is a dict lookup, no IO on the request path. Revocations are
+    written to the `revoked_tokens` table so they survive restarts and reach
+    the other workers, which pull new rows every `sync_interval` seconds.
+    Entries are dropped once the token they name has expired anyway.
+    '''
+    def __init__(self, sync_interval: float):
+        self.sync_interval = sync_interval
+        self._expiry: dict[str, int] = {}
+        self._last_id = 0
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._expiry)
+
+    def is_revoked(self, jti: str | None) -> bool:
+        if jti is None:
+            return False
+        expires_at = self._expiry.get(jti)
+        return expires_at is not None and expires_at > time.time()
+
+    def _add(self, jti: str, expires_at: int):
+        with self._lock:
+            self._expiry[jti] = expires_at
+
+    def prune(self):
+        ''' Forget revocations of tokens that have expired '''
+        now = time.time()
+        with self._lock:
+            for jti in [jti for jti, expires_at in self._expiry.items() if expires_at <= now]:
+                del self._expiry[jti]
+
+    async def sync(self, db: AsyncSession):
+        ''' Load the revocations recorded since the last sync, by any worker '''
+        result = await db.execute(
+            select(RevokedToken.id, RevokedToken.jti, RevokedToken.expires_at)
+            .where(RevokedToken.id > self._last_id, RevokedToken.expires_at > int(time.time()))
+            .order_by(RevokedToken.id)
+        )
+        for row_id, jti, expires_at in result.all():
+            self._add(jti, expires_at)
+            self._last_id = row_id
+        self.prune()
+
+    async def revoke(self, db: AsyncSession, jti: str, expires_at: int) -> bool:
+        ''' Revoke one token until `expires_at` (its exp claim) and commit.
+        False if it was already revoked, here or by any worker: the unique jti
+        makes the table the arbiter, so single-use tokens are used once '''
+        if self.is_revoked(jti):
+            return False
+        # expired rows can go, the tokens they name are rejected on exp alone
+        await db.execute(delete(RevokedToken).where(RevokedToken.expires_at <= int(time.time())))
+        try:
+            await db.execute(insert(RevokedToken).values(jti=jti, expires_at=expires_at))
+            await db.commit()
+            revoked = True
+        except IntegrityError:
+            # revoked concurrently by another request
+            await db.rollback()
+            revoked = False
+        self._add(jti, expires_at)
+        return revoked
+
+    async def keep_synced(self, session_factory):
+        ''' Sync forever, run as a background task for the lifetime of the app '''
+        while True:
+            try:
+                async with session_factory() as db:
+                    await self.sync(db)
+            except Exception as e:  # keep serving with what is known, retry next round
+                logger.warning("Revocation sync failed: %s", e)
+            await asyncio.sleep(self.sync_interval)
+
+    def clear(self):
+        with self._lock:
+            self._expiry.clear()
+        self._last_id = 0
+
+
+revocation_list = RevocationList(settings.REVOCATION_SYNC_SECONDS)
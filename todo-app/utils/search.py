@@ -0,0 +1,45 @@
+''' Full-text search over tasks, backed by FTS5 on SQLite and tsvector/GIN on Postgres '''
+import re
+from sqlalchemy import column, func, literal_column, select, table
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.base import Task, TASK_SEARCH_VECTOR
+
+tasks_fts = table("tasks_fts", column("rowid"))
+
+
+def fts5_query(q: str) -> str:
+    ''' Turn free text into an FTS5 query: every word must match, the last one as a prefix.
+
+    Words are quoted so user input can never be read as FTS5 operators.
+    '''
+    words = re.findall(r"\w+", q)
+    if not words:
+        return ""
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+async def find_tasks(db: AsyncSession, q: str, limit: int, offset: int) -> list[Task]:
+    ''' Tasks matching `q`, best match first '''
+    if db.bind.dialect.name == "postgresql":
+        vector = literal_column(TASK_SEARCH_VECTOR)
+        query = func.plainto_tsquery("english", q)
+        stmt = (
+            select(Task)
+            .where(vector.op("@@")(query))
+            .order_by(func.ts_rank(vector, query).desc(), Task.id)
+        )
+    else:
+        match = fts5_query(q)
+        if not match:
+            return []
+        stmt = (
+            select(Task)
+            .join(tasks_fts, tasks_fts.c.rowid == Task.id)
+            .where(literal_column("tasks_fts").op("MATCH")(match))
+            # bm25() is lower for better matches
+            .order_by(func.bm25(literal_column("tasks_fts")), Task.id)
+        )
+    result = await db.execute(stmt.limit(limit).offset(offset))
+    return list(result.scalars().all())
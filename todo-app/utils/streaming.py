@@ -0,0 +1,42 @@
+''' Streaming NDJSON export for bulk consumers of the list endpoints '''
+import orjson
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from utils.fast_json import schema_columns
+
+EXPORT_BATCH_SIZE = 1000
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def ndjson_export(db: AsyncSession, model, schema: type[BaseModel], *criteria) -> StreamingResponse:
+    ''' Stream every row of `model` as one JSON document per line.
+
+    Rows are fetched with `yield_per` so the driver hands them over in batches
+    of EXPORT_BATCH_SIZE, and each batch is written out before the next one is
+    read, so memory stays bounded by the batch size instead of the table size.
+    With FAST_LIST_RESPONSES only the schema's columns are selected and each
+    row is encoded by orjson directly, skipping ORM objects and validation.
+    '''
+    fast = settings.FAST_LIST_RESPONSES
+    stmt = (
+        select(*schema_columns(model, schema)) if fast else select(model)
+    ).where(*criteria).order_by(model.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    async def generate_fast():
+        result = await db.stream(stmt)
+        async for batch in result.mappings().partitions():
+            yield b"".join(orjson.dumps(dict(row), option=orjson.OPT_APPEND_NEWLINE) for row in batch)
+
+    async def generate():
+        result = await db.stream(stmt)
+        async for batch in result.scalars().partitions():
+            yield "".join(
+                schema.model_validate(row, from_attributes=True).model_dump_json() + "\n"
+                for row in batch
+            )
+            db.expunge_all()
+
+    return StreamingResponse(generate_fast() if fast else generate(), media_type=NDJSON_MEDIA_TYPE)
@@ -0,0 +1,61 @@
+''' Task statistics read from task_stats, the summary table triggers keep in step with `tasks` '''
+from sqlalchemy import case, delete, func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+from models.base import Task, TaskStat, User
+from schemas.task import PriorityCount, TaskStats
+
+
+def summarize(rows) -> TaskStats:
+    ''' Stats from (status, priority, task_count) rows, priorities in ascending order, none last '''
+    stats = TaskStats()
+    by_priority: dict[int | None, PriorityCount] = {}
+    for completed, priority, count in rows:
+        if not count:
+            continue
+        bucket = by_priority.setdefault(priority, PriorityCount(priority=priority, total=0, completed=0))
+        bucket.total += count
+        stats.total += count
+        if completed:
+            bucket.completed += count
+            stats.completed += count
+    stats.open = stats.total - stats.completed
+    stats.by_priority = sorted(by_priority.values(), key=lambda p: (p.priority is None, p.priority or 0))
+    return stats
+
+
+async def user_stats(db: AsyncSession, user_id: int) -> TaskStats:
+    ''' Stats of one user's tasks: a handful of rows, however many tasks the user has '''
+    result = await db.execute(
+        select(TaskStat.status, TaskStat.priority, TaskStat.task_count).where(TaskStat.user_id == user_id)
+    )
+    return summarize(result.all())
+
+
+async def company_stats(db: AsyncSession, company_id: int) -> TaskStats:
+    ''' Stats of the tasks of a company's users, summed over their buckets '''
+    result = await db.execute(
+        select(TaskStat.status, TaskStat.priority, func.sum(TaskStat.task_count))
+        .join(User, TaskStat.user_id == User.id)
+        .where(User.company_id == company_id)
+        .group_by(TaskStat.status, TaskStat.priority)
+    )
+    return summarize(result.all())
+
+
+async def rebuild(conn: AsyncConnection) -> int:
+    ''' Recount task_stats from `tasks`, for drift (e.g. rows written with the triggers
+    disabled). Run inside a transaction; returns the number of buckets written. '''
+    if conn.dialect.name == "postgresql":
+        # writes to tasks wait until the recount commits, so none of them is lost
+        await conn.execute(text("LOCK TABLE tasks IN SHARE MODE"))
+    completed = case((func.lower(Task.status).in_(["1", "true", "t"]), 1), else_=0)
+    await conn.execute(delete(TaskStat))
+    result = await conn.execute(
+        insert(TaskStat).from_select(
+            ["user_id", "status", "priority", "task_count"],
+            select(Task.user_id, completed, Task.priority, func.count())
+            .where(Task.user_id.is_not(None))
+            .group_by(Task.user_id, completed, Task.priority),
+        )
+    )
+    return result.rowcount
@@ -0,0 +1,68 @@
+''' In-process cache of authenticated users, keyed by token subject (username) '''
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Hashable
+from config import settings
+
+
+class TTLCache:
+    ''' Size-bounded LRU cache whose entries also expire after `ttl` seconds '''
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable) -> Any | None:
+        ''' Return the cached value, or None when missing or expired '''
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        ''' Store a value, evicting the least recently used entry when full '''
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        ''' Drop one entry if present '''
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        ''' Drop every entry '''
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# Keep USER_CACHE_TTL_SECONDS well below the access token lifetime so
+# changes made outside the API still reach every worker in bounded time
+user_cache = TTLCache(settings.USER_CACHE_MAX_SIZE, settings.USER_CACHE_TTL_SECONDS)
+
+# current token version per user ID, for stateless token validation
+token_versions = TTLCache(settings.USER_CACHE_MAX_SIZE, settings.USER_CACHE_TTL_SECONDS)
+
+
+def invalidate_user(*usernames: str | None, user_id: int | None = None):
+    ''' Forget cached principals, call after a user is changed or deleted '''
+    for username in usernames:
+        if username is not None:
+            user_cache.pop(username)
+    if user_id is not None:
+        token_versions.pop(user_id)
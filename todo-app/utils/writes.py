@@ -0,0 +1,59 @@
+''' Single-statement writes: the database enforces uniqueness and foreign keys,
+violations are reported as 400s instead of being checked with extra queries '''
+from fastapi import HTTPException
+from sqlalchemy import Column, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# SQLite names no column when a foreign key fails
+SQLITE_FOREIGN_KEY_ERROR = "FOREIGN KEY constraint failed"
+
+
+def violated(error: IntegrityError, column: Column) -> bool:
+    ''' Whether `error` is the unique or foreign key constraint on `column` failing.
+    SQLite reports "UNIQUE constraint failed: users.email", Postgres "Key (email)=(...)" '''
+    message = str(error.orig)
+    if f"({column.name})" in message:
+        return True
+    if column.foreign_keys:
+        return SQLITE_FOREIGN_KEY_ERROR in message
+    return f"{column.table.name}.{column.name}" in message
+
+
+async def write_returning(db: AsyncSession, stmt, errors: dict[Column, str]):
+    ''' Run an INSERT/UPDATE ... RETURNING of one entity and commit, in one round trip.
+
+    Returns the written object, None if an UPDATE matched no row. A violated
+    constraint listed in `errors` (column -> detail) becomes a 400 with that detail.
+    '''
+    try:
+        written = await db.scalar(stmt)
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        for column, detail in errors.items():
+            if violated(e, column):
+                raise HTTPException(400, detail=detail) from e
+        raise
+    return written
+
+
+async def patch_returning(db: AsyncSession, model, row_id: int, changes: dict, version: int | None,
+                          errors: dict[Column, str]):
+    ''' UPDATE only the `changes` columns of one row, bumping its version, in one statement.
+
+    With `version` the row is only written if it is still at that version:
+    409 if it has moved on. Returns the updated object, None if there is no such row.
+    '''
+    conditions = [model.id == row_id]
+    if version is not None:
+        conditions.append(model.version == version)
+    if changes:
+        stmt = update(model).where(*conditions).values(**changes, version=model.version + 1).returning(model)
+        written = await write_returning(db, stmt, errors)
+    else:
+        # nothing to write, answer with the current row
+        written = await db.scalar(select(model).where(*conditions))
+    if written is None and version is not None and await db.get(model, row_id) is not None:
+        raise HTTPException(409, detail=f"Version {version} is out of date, reload and retry")
+    return written
@@ -0,0 +1,62 @@
+"""task full text search
+
+Revision ID: 5d2c8e61a9f4
+Revises: 0bf48392b19c
+Create Date: 2026-10-18 10:02:17.845112
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2c8e61a9f4'
+down_revision: Union[str, Sequence[str], None] = '0bf48392b19c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_VECTOR = "to_tsvector('english', coalesce(summary, '') || ' ' || coalesce(description, ''))"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(f"CREATE INDEX ix_tasks_search ON tasks USING gin ({SEARCH_VECTOR})")
+        return
+    op.execute(
+        "CREATE VIRTUAL TABLE tasks_fts USING fts5("
+        "summary, description, content='tasks', content_rowid='id')"
+    )
+    op.execute(
+        "CREATE TRIGGER tasks_fts_ai AFTER INSERT ON tasks BEGIN "
+        "INSERT INTO tasks_fts(rowid, summary, description) VALUES (new.id, new.summary, new.description); "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER tasks_fts_ad AFTER DELETE ON tasks BEGIN "
+        "INSERT INTO tasks_fts(tasks_fts, rowid, summary, description) "
+        "VALUES ('delete', old.id, old.summary, old.description); "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER tasks_fts_au AFTER UPDATE OF summary, description ON tasks BEGIN "
+        "INSERT INTO tasks_fts(tasks_fts, rowid, summary, description) "
+        "VALUES ('delete', old.id, old.summary, old.description); "
+        "INSERT INTO tasks_fts(rowid, summary, description) VALUES (new.id, new.summary, new.description); "
+        "END"
+    )
+    # index the rows that already exist
+    op.execute("INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("DROP INDEX ix_tasks_search")
+        return
+    op.execute("DROP TRIGGER tasks_fts_au")
+    op.execute("DROP TRIGGER tasks_fts_ad")
+    op.execute("DROP TRIGGER tasks_fts_ai")
+    op.execute("DROP TABLE tasks_fts")
@@ -0,0 +1,28 @@
+"""user token version
+
+Revision ID: 7a1e3c9b2d40
+Revises: 5d2c8e61a9f4
+Create Date: 2026-10-18 11:20:43.518270
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a1e3c9b2d40'
+down_revision: Union[str, Sequence[str], None] = '5d2c8e61a9f4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'token_version')
@@ -0,0 +1,30 @@
+"""row versions
+
+Revision ID: b3e8d1f5c207
+Revises: 9c4b2f7e1a63
+Create Date: 2026-10-18 15:42:08.731954
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e8d1f5c207'
+down_revision: Union[str, Sequence[str], None] = '9c4b2f7e1a63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('companies', sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('tasks', sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('tasks', 'version')
+    op.drop_column('companies', 'version')
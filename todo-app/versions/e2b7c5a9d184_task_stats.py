@@ -0,0 +1,85 @@
+"""task stats
+
+Revision ID: e2b7c5a9d184
+Revises: d6a0f4c83e19
+Create Date: 2026-10-18 18:24:51.118406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b7c5a9d184'
+down_revision: Union[str, Sequence[str], None] = 'd6a0f4c83e19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+STATUS_BUCKET = "CASE WHEN lower(coalesce({row}.status, '')) IN ('1', 'true', 't') THEN 1 ELSE 0 END"
+REMOVE = (
+    "UPDATE task_stats SET task_count = task_count - 1 WHERE user_id = old.user_id "
+    f"AND status = {STATUS_BUCKET.format(row='old')} "
+    "AND coalesce(priority, -1) = coalesce(old.priority, -1)"
+)
+ADD = (
+    "INSERT INTO task_stats (user_id, status, priority, task_count) "
+    f"SELECT new.user_id, {STATUS_BUCKET.format(row='new')}, new.priority, 1 "
+    "WHERE new.user_id IS NOT NULL "
+    "ON CONFLICT (user_id, status, coalesce(priority, -1)) "
+    "DO UPDATE SET task_count = task_stats.task_count + 1"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('task_stats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.Integer(), nullable=False),
+    sa.Column('priority', sa.Integer(), nullable=True),
+    sa.Column('task_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("CREATE UNIQUE INDEX ux_task_stats_bucket ON task_stats (user_id, status, coalesce(priority, -1))")
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(
+            "CREATE OR REPLACE FUNCTION task_stats_sync() RETURNS trigger AS $$ BEGIN "
+            f"IF TG_OP <> 'INSERT' THEN {REMOVE}; END IF; "
+            f"IF TG_OP <> 'DELETE' THEN {ADD}; END IF; "
+            "RETURN NULL; END $$ LANGUAGE plpgsql"
+        )
+        # no task is written between the count below and the trigger taking over
+        op.execute("LOCK TABLE tasks IN SHARE MODE")
+        op.execute(
+            "CREATE TRIGGER task_stats_sync AFTER INSERT OR DELETE OR UPDATE OF user_id, status, priority "
+            "ON tasks FOR EACH ROW EXECUTE FUNCTION task_stats_sync()"
+        )
+    else:
+        op.execute(f"CREATE TRIGGER task_stats_ai AFTER INSERT ON tasks BEGIN {ADD}; END")
+        op.execute(f"CREATE TRIGGER task_stats_ad AFTER DELETE ON tasks BEGIN {REMOVE}; END")
+        op.execute(
+            "CREATE TRIGGER task_stats_au AFTER UPDATE OF user_id, status, priority ON tasks BEGIN "
+            f"{REMOVE}; {ADD}; END"
+        )
+    # count the tasks that already exist
+    op.execute(
+        "INSERT INTO task_stats (user_id, status, priority, task_count) "
+        f"SELECT user_id, {STATUS_BUCKET.format(row='tasks')}, priority, count(*) FROM tasks "
+        f"WHERE user_id IS NOT NULL GROUP BY user_id, {STATUS_BUCKET.format(row='tasks')}, priority"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("DROP TRIGGER task_stats_sync ON tasks")
+        op.execute("DROP FUNCTION task_stats_sync()")
+    else:
+        op.execute("DROP TRIGGER task_stats_au")
+        op.execute("DROP TRIGGER task_stats_ad")
+        op.execute("DROP TRIGGER task_stats_ai")
+    op.execute("DROP INDEX ux_task_stats_bucket")
+    op.drop_table('task_stats')
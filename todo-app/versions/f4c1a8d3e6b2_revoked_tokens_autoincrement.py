@@ -0,0 +1,38 @@
+"""revoked tokens autoincrement
+
+Revision ID: f4c1a8d3e6b2
+Revises: e2b7c5a9d184
+Create Date: 2026-10-18 21:12:40.583017
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4c1a8d3e6b2'
+down_revision: Union[str, Sequence[str], None] = 'e2b7c5a9d184'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Postgres ids come from a sequence and never go back; SQLite needs AUTOINCREMENT,
+    # which it only takes when the table is created, so the table is copied
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    with op.batch_alter_table(
+        'revoked_tokens', recreate='always', table_kwargs={'sqlite_autoincrement': True}
+    ):
+        pass
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    with op.batch_alter_table('revoked_tokens', recreate='always'):
+        pass